@@ -14,11 +14,22 @@ OUTPUT_DIR = 'data/graphs'
 TRAIN_STATIONS_JSON = f'{OUTPUT_DIR}/train_stations.json'
 CONNECTION_REPORT = f'{OUTPUT_DIR}/connection_report.txt'
 COMBINED_GRAPH_PATH = f'{OUTPUT_DIR}/combined_graph.gpickle'
+COMBINED_GRAPH_BIN_PATH = f'{OUTPUT_DIR}/combined_graph_bin'
 COMBINED_VISUALIZATION = f'{OUTPUT_DIR}/combined_network.html'
 STATIC_GRAPH_IMAGE = f'{OUTPUT_DIR}/combined_network.png'
+COMBINED_CH_PATH = f'{OUTPUT_DIR}/combined_graph_ch.pkl'
+COMBINED_MAP_CACHE = f'{OUTPUT_DIR}/combined_map_cache.npz'
+
+# Graph I/O
+PICKLE_PROTOCOL = 5          # Pickle protocol used when saving graphs
+IO_BUFFER_SIZE = 1 << 20     # 1 MiB read/write buffer for graph pickles
+
+# Contraction Hierarchy
+CH_WITNESS_SETTLE_LIMIT = 50  # Max nodes settled per witness search (extra shortcuts, never wrong answers)
+CH_CORE_DEGREE = 64           # Nodes with more in+out edges than this are left uncontracted
 
 # Train Station Identification (GTFS route_type for trains)
-TRAIN_ROUTE_TYPES = [1, 2]
+TRAIN_ROUTE_TYPES = frozenset({1, 2})
 
 # Connection Parameters
 MAX_WALKING_DISTANCE_M = 2000 #meters
@@ -48,6 +59,31 @@ MODE_WEIGHTS = {
     'connection': 2.0
 }
 
+# Douglas-Peucker tolerance (meters) when simplifying each mode's polylines
+SIMPLIFY_TOLERANCE_M = {
+    'car': 5.0,
+    'train': 2.0,
+    'tram': 2.0,
+    'bus': 5.0,
+    'walk': 5.0
+}
+
+# Only draw edges with an endpoint inside (min_lat, min_lon, max_lat, max_lon);
+# None draws the whole network
+MAP_BOUNDS = None
+
+# Interactive map overview level: below MAP_DETAIL_ZOOM the dense layers listed here
+# show a copy snapped to a grid of this many meters (duplicates dropped), like a
+# coarser tile level. Walk is by far the densest layer, so its grid is much coarser
+MAP_DETAIL_ZOOM = 15
+MAP_OVERVIEW_GRID_M = {
+    'car': 50,
+    'walk': 500
+}
+
+# Layers left unticked in the layer control; their files are only fetched once shown
+MAP_HIDDEN_MODES = ('walk',)
+
 # Logging
 LOG_LEVEL = 'INFO'
 LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
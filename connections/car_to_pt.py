@@ -8,8 +8,6 @@ import pickle
 import json
 import logging
 import os
-from geopy.distance import geodesic
-from scipy.spatial import KDTree
 import numpy as np
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -17,24 +15,40 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config_integration import (
     CAR_GRAPH_PATH, TRAIN_STATIONS_JSON, CONNECTION_REPORT,
     OUTPUT_DIR, MAX_WALKING_DISTANCE_M, WALKING_SPEED,
-    LOG_LEVEL, LOG_FORMAT, DETAILED_CONNECTION_LOGS
+    LOG_LEVEL, LOG_FORMAT, DETAILED_CONNECTION_LOGS,
+    IO_BUFFER_SIZE
 )
+from connections.geo import geodesic_m
+from connections.spatial_index import get_spatial_index
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
+# One row per car-to-PT connection (structured array instead of a list of dicts)
+CONNECTION_DTYPE = np.dtype([
+    ('station_id', 'U64'),
+    ('station_name', 'U128'),
+    ('station_lat', 'f8'),
+    ('station_lon', 'f8'),
+    ('road_node', 'U64'),
+    ('road_lat', 'f8'),
+    ('road_lon', 'f8'),
+    ('distance', 'f8'),
+    ('walk_time', 'f8')
+])
+
 class CarToPTConnector:
     def __init__(self, max_distance=MAX_WALKING_DISTANCE_M):
         self.max_distance = max_distance
         self.walking_speed = WALKING_SPEED
-        self.connections = []
+        self.connections = np.empty(0, dtype=CONNECTION_DTYPE)
 
     def load_graphs(self):
         """Load car graph and train stations"""
         logger.info(f"Loading car graph from {CAR_GRAPH_PATH}...")
         
         try:
-            with open(CAR_GRAPH_PATH, 'rb') as f:
+            with open(CAR_GRAPH_PATH, 'rb', buffering=IO_BUFFER_SIZE) as f:
                 self.G_car = pickle.load(f)
             logger.info(f"✅ Car graph loaded: {self.G_car.number_of_nodes():,} nodes, {self.G_car.number_of_edges():,} edges")
         except FileNotFoundError:
@@ -56,20 +70,12 @@ class CarToPTConnector:
         """Build KDTree for efficient nearest-neighbor search"""
         logger.info("\nBuilding spatial index for road nodes...")
         
-        # Extract road node coordinates
-        self.road_nodes = []
-        self.road_coords = []
-        
-        for node_id, node_data in self.G_car.nodes(data=True):
-            lat = node_data.get('lat')
-            lon = node_data.get('lon')
-            
-            if lat and lon:
-                self.road_nodes.append(node_id)
-                self.road_coords.append([lat, lon])
+        # Same index type and projection as the PT builder
+        self.road_index = get_spatial_index(self.G_car)
         
-        self.road_coords = np.array(self.road_coords)
-        self.road_tree = KDTree(self.road_coords)
+        self.road_nodes = self.road_index.node_ids
+        self.road_coords = self.road_index.coords
+        self.road_tree = self.road_index.tree
         
         logger.info(f"✅ Indexed {len(self.road_nodes):,} road nodes")
         
@@ -80,62 +86,57 @@ class CarToPTConnector:
         logger.info("="*60)
         logger.info(f"Max walking distance: {self.max_distance}m")
         
-        self.connections = []
-        stations_connected = 0
-        stations_too_far = 0
+        # Station columns as arrays so every per-station step below is vectorized
+        station_ids = np.array([s['id'] for s in self.train_stations], dtype=object)
+        station_names = np.array([s['name'] for s in self.train_stations], dtype=object)
+        # reshape keeps the (n, 2) layout when there are no stations
+        station_coords = np.array(
+            [[s['lat'], s['lon']] for s in self.train_stations], dtype=float
+        ).reshape(-1, 2)
+        station_xy = self.road_index.project(station_coords)
         
-        for station in self.train_stations:
-            station_coord = [station['lat'], station['lon']]
-            
-            # Convert max distance to approximate degrees for KDTree
-            search_radius_deg = self.max_distance / 111320
-            
-            # Find all road nodes within search radius
-            indices = self.road_tree.query_ball_point(station_coord, search_radius_deg)
-            
-            if not indices:
-                stations_too_far += 1
-                logger.warning(f"⚠️  {station['name']}: No road nodes within {self.max_distance}m")
-                continue
-            
-            # Calculate exact distances and find closest
-            closest_road = None
-            min_distance = float('inf')  # ← FIXED: Initialize here!
-            
-            for idx in indices:
-                road_node_id = self.road_nodes[idx]
-                road_coord = self.road_coords[idx]
-                
-                # Calculate exact distance
-                distance = geodesic(station_coord, road_coord).meters
-                
-                if distance < min_distance and distance <= self.max_distance:
-                    min_distance = distance
-                    closest_road = road_node_id
-            
-            if closest_road:
-                # Calculate walking time
-                walk_time = min_distance / self.walking_speed
-                
-                connection = {
-                    'station_id': station['id'],
-                    'station_name': station['name'],
-                    'station_lat': station['lat'],
-                    'station_lon': station['lon'],
-                    'road_node': closest_road,
-                    'road_lat': self.G_car.nodes[closest_road]['lat'],
-                    'road_lon': self.G_car.nodes[closest_road]['lon'],
-                    'distance': min_distance,
-                    'walk_time': walk_time
-                }
-                
-                self.connections.append(connection)
-                stations_connected += 1
-                
-                logger.info(f"✅ {station['name']}: {closest_road} ({min_distance:.1f}m, {walk_time/60:.1f}min)")
-            else:
-                stations_too_far += 1
-                logger.warning(f"⚠️  {station['name']}: No road within {self.max_distance}m")
+        # Find the nearest road node for every station in one batched query;
+        # stations with nothing in range come back with index == len(road_nodes)
+        _, nearest_idx = self.road_tree.query(
+            station_xy, k=1, distance_upper_bound=self.max_distance, workers=-1
+        )
+        found = nearest_idx < len(self.road_nodes)
+        
+        # Refine the projected distance to exact geodesic meters for each winner only
+        distances = np.full(len(station_coords), np.inf)
+        nearest = self.road_coords[nearest_idx[found]]
+        distances[found] = geodesic_m(
+            station_coords[found, 0], station_coords[found, 1],
+            nearest[:, 0], nearest[:, 1]
+        )
+        
+        connected = distances <= self.max_distance
+        road_idx = nearest_idx[connected]
+        
+        # Fill the connection table column by column
+        connections = np.empty(len(road_idx), dtype=CONNECTION_DTYPE)
+        connections['station_id'] = station_ids[connected]
+        connections['station_name'] = station_names[connected]
+        connections['station_lat'] = station_coords[connected, 0]
+        connections['station_lon'] = station_coords[connected, 1]
+        connections['road_node'] = self.road_nodes[road_idx]
+        connections['road_lat'] = self.road_coords[road_idx, 0]
+        connections['road_lon'] = self.road_coords[road_idx, 1]
+        connections['distance'] = distances[connected]
+        connections['walk_time'] = distances[connected] / self.walking_speed
+        self.connections = connections
+        
+        if DETAILED_CONNECTION_LOGS:
+            for conn in connections:
+                logger.info(f"✅ {conn['station_name']}: {conn['road_node']} ({conn['distance']:.1f}m, {conn['walk_time']/60:.1f}min)")
+        
+        # One aggregate warning instead of one per unconnected station
+        self.skipped = station_names[~connected].tolist()
+        if self.skipped:
+            logger.warning(f"⚠️  {len(self.skipped)} stations have no road within {self.max_distance}m: {', '.join(self.skipped[:20])}")
+        
+        stations_connected = len(connections)
+        stations_too_far = len(self.train_stations) - stations_connected
         
         logger.info(f"\n📊 Connection Summary:")
         logger.info(f"  Stations connected: {stations_connected} / {len(self.train_stations)}")
@@ -152,44 +153,59 @@ class CarToPTConnector:
 
         os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-        with open(CONNECTION_REPORT, 'w') as f:
-            f.write("="*60 + "\n")
-            f.write("CAR TO PT CONNECTION REPORT\n")
-            f.write("="*60 + "\n\n")
-            
-            f.write(f"Total train stations: {len(self.train_stations)}\n")
-            f.write(f"Stations connected: {len(self.connections)}\n")
-            f.write(f"Stations not connected: {len(self.train_stations) - len(self.connections)}\n")
-            f.write(f"Max walking distance: {self.max_distance}m\n\n")
-            
-            f.write("="*60 + "\n")
-            f.write("CONNECTION DETAILS\n")
-            f.write("="*60 + "\n\n")
-            
-            for i, conn in enumerate(self.connections, 1):
-                f.write(f"{i}. {conn['station_name']}\n")
-                f.write(f"   Station ID: {conn['station_id']}\n")
-                f.write(f"   Station Location: ({conn['station_lat']:.6f}, {conn['station_lon']:.6f})\n")
-                f.write(f"   Connected to Road Node: {conn['road_node']}\n")
-                f.write(f"   Road Location: ({conn['road_lat']:.6f}, {conn['road_lon']:.6f})\n")
-                f.write(f"   Walking Distance: {conn['distance']:.1f}m\n")
-                f.write(f"   Walking Time: {conn['walk_time']/60:.1f} minutes\n\n")
+        rule = "="*60 + "\n"
+        
+        # Assemble the whole report in memory and write it in one call
+        parts = [
+            rule,
+            "CAR TO PT CONNECTION REPORT\n",
+            rule + "\n",
+            f"Total train stations: {len(self.train_stations)}\n"
+            f"Stations connected: {len(self.connections)}\n"
+            f"Stations not connected: {len(self.train_stations) - len(self.connections)}\n"
+            f"Max walking distance: {self.max_distance}m\n\n",
+            rule,
+            "CONNECTION DETAILS\n",
+            rule + "\n"
+        ]
+        
+        for i, conn in enumerate(self.connections.tolist(), 1):
+            station_id, station_name, station_lat, station_lon, road_node, road_lat, road_lon, distance, walk_time = conn
+            parts.append(
+                f"{i}. {station_name}\n"
+                f"   Station ID: {station_id}\n"
+                f"   Station Location: ({station_lat:.6f}, {station_lon:.6f})\n"
+                f"   Connected to Road Node: {road_node}\n"
+                f"   Road Location: ({road_lat:.6f}, {road_lon:.6f})\n"
+                f"   Walking Distance: {distance:.1f}m\n"
+                f"   Walking Time: {walk_time/60:.1f} minutes\n\n"
+            )
+        
+        # Statistics
+        if len(self.connections):
+            distances = self.connections['distance']
+            times = self.connections['walk_time'] / 60
             
-            # Statistics
-            if self.connections:
-                distances = [c['distance'] for c in self.connections]
-                times = [c['walk_time']/60 for c in self.connections]
-                
-                f.write("="*60 + "\n")
-                f.write("STATISTICS\n")
-                f.write("="*60 + "\n\n")
-                f.write(f"Average walking distance: {np.mean(distances):.1f}m\n")
-                f.write(f"Min walking distance: {np.min(distances):.1f}m\n")
-                f.write(f"Max walking distance: {np.max(distances):.1f}m\n")
-                f.write(f"Average walking time: {np.mean(times):.1f} minutes\n")
+            parts.append(
+                rule +
+                "STATISTICS\n" +
+                rule + "\n" +
+                f"Average walking distance: {distances.mean():.1f}m\n"
+                f"Min walking distance: {distances.min():.1f}m\n"
+                f"Max walking distance: {distances.max():.1f}m\n"
+                f"Average walking time: {times.mean():.1f} minutes\n"
+            )
+        
+        with open(CONNECTION_REPORT, 'w') as f:
+            f.write("".join(parts))
         
         logger.info(f"✅ Report saved to {CONNECTION_REPORT}")
 
+    def connection_records(self):
+        """Connections as a list of plain dicts (for JSON output)"""
+        names = self.connections.dtype.names
+        return [dict(zip(names, row)) for row in self.connections.tolist()]
+
 
 def main():
     """Main execution"""
@@ -216,7 +232,7 @@ def main():
     # Save connections as JSON for next step
     connections_file = os.path.join(OUTPUT_DIR, 'connections.json')
     with open(connections_file, 'w') as f:
-        json.dump(connections, f, indent=2)
+        json.dump(connector.connection_records(), f, indent=2)
     logger.info(f"💾 Connections saved to {connections_file}")
     
     logger.info("\n" + "="*60)
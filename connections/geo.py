@@ -0,0 +1,55 @@
+"""
+Geographic helpers shared by the connection builders
+Vectorized distance calculations on lat/lon arrays
+"""
+
+import numpy as np
+from pyproj import Geod
+
+EARTH_RADIUS_M = 6371000  # meters
+
+# WGS84 ellipsoid for exact geodesic distances (compiled GeographicLib)
+GEOD = Geod(ellps='WGS84')
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Haversine distance in meters between coordinates given in radians.
+
+    Accepts scalars or NumPy arrays (broadcast), so a whole batch of
+    candidates is measured in one pass.
+    """
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def geodesic_m(lat1, lon1, lat2, lon2):
+    """WGS84 geodesic distance in meters between coordinates given in degrees.
+
+    Accepts scalars or equal-length arrays; arrays are measured in a single call.
+    """
+    _, _, distance = GEOD.inv(lon1, lat1, lon2, lat2)
+    return distance
+
+
+def project_to_local_xy(coords, origin=None):
+    """Project (N, 2) lat/lon degrees onto a local equirectangular plane in meters.
+
+    Euclidean distance in the returned frame approximates ground distance
+    near `origin` (lat, lon), which defaults to the centroid of `coords`.
+    Returns the projected (N, 2) array and the origin used, so query points
+    can be projected into the same frame.
+    """
+    coords = np.asarray(coords, dtype=float)
+
+    if origin is None:
+        origin = coords.mean(axis=0)
+    lat0, lon0 = origin
+
+    x = np.radians(coords[:, 1] - lon0) * EARTH_RADIUS_M * np.cos(np.radians(lat0))
+    y = np.radians(coords[:, 0] - lat0) * EARTH_RADIUS_M
+
+    return np.column_stack([x, y]), (lat0, lon0)
@@ -7,8 +7,7 @@ Simplification: only in region of train stations
 
 import networkx as nx
 import pickle
-from geopy.distance import geodesic
-from scipy.spatial import KDTree
+from collections import defaultdict
 import numpy as np
 import logging
 import os
@@ -18,8 +17,11 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config_integration import (
     PT_GRAPH_PATH, OUTPUT_DIR,
     MAX_WALKING_DISTANCE_M, WALKING_SPEED,
-    LOG_LEVEL, LOG_FORMAT
+    LOG_LEVEL, LOG_FORMAT,
+    IO_BUFFER_SIZE, PICKLE_PROTOCOL
 )
+from connections.geo import haversine_m
+from connections.spatial_index import get_spatial_index
 
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
@@ -34,6 +36,11 @@ class PTWalkingConnectionBuilder:
         self.walking_speed = WALKING_SPEED
         
     def add_walking_edges(self):
+        """
+        Clear all PT walking transfers, then rebuild them from scratch.
+        Every walking edge in the graph afterwards comes from add_connections,
+        so only pre-existing non-walking edges need checking for overlaps.
+        """
         logger.info("="*60)
         logger.info("ADDING PT WALKING CONNECTIONS")
         logger.info("="*60)
@@ -51,20 +58,18 @@ class PTWalkingConnectionBuilder:
         
         logger.info(f"✅ Removed {len(edges_to_remove)} existing walking edges")
         
-        # Extract PT nodes with coordinates
-        pt_nodes = self.extract_pt_nodes()
-        logger.info(f"Found {len(pt_nodes)} PT stops with coordinates")
+        # Extract PT nodes with coordinates and build spatial index
+        index = self.build_spatial_index()
+        logger.info(f"Found {len(index)} PT stops with coordinates")
         
-        if len(pt_nodes) == 0:
+        if len(index) == 0:
             logger.error("❌ No PT nodes found! Check your graph structure.")
             return {"error": "no_pt_nodes"}
         
-        # Build spatial index
-        node_ids, coords = self.build_spatial_index(pt_nodes)
         logger.info("Built spatial index (KDTree)")
         
         # Find and add walking connections
-        stats = self.add_connections(node_ids, coords)
+        stats = self.add_connections(index)
         
         logger.info(f"\n✅ Walking connection generation complete!")
         logger.info(f"   Added {stats['edges_added']:,} walking edges")
@@ -75,148 +80,112 @@ class PTWalkingConnectionBuilder:
         
         return stats
     
-    def extract_pt_nodes(self):
-        pt_nodes = []
-
-        for node_id, node_data in self.graph.nodes(data=True):
-            if 'lat' in node_data and 'lon' in node_data:
-                pt_nodes.append((node_id, node_data))
-            else:
-                logger.warning(f"Node {node_id} missing coordinates, skipping")
-            
-        return pt_nodes
-    
-    def build_spatial_index(self, pt_nodes):
+    def build_spatial_index(self):
         """ Build KDTree for efficient nearest-neighbor search """
-        node_ids = []
-        coords = []
+        index = get_spatial_index(self.graph)
         
-        for node_id, node_data in pt_nodes:
-            lat = node_data['lat']
-            lon = node_data['lon']
-            node_ids.append(node_id)
-            coords.append([lat, lon])
+        if index.skipped:
+            logger.warning(f"{len(index.skipped)} nodes missing coordinates, skipping: {', '.join(map(str, index.skipped[:20]))}")
         
-        coords = np.array(coords)
-        tree = KDTree(coords)
+        self.pt_index = index
+        self.pt_node_ids = index.node_ids
+        self.pt_coords = index.coords
+        self.pt_xy = index.xy
+        self.pt_tree = index.tree
         
-        self.pt_node_ids = node_ids
-        self.pt_coords = coords
-        self.pt_tree = tree
-        
-        return node_ids, coords
+        return index
     
-    def add_connections(self, node_ids, coords):
-        #Build KDTree
-        tree = KDTree(coords)
-
+    def add_connections(self, index):
+        node_ids = index.node_ids
+        
         stats = {
             'edges_added': 0,
             'unique_pairs': 0,
-            'nodes_checked': 0,
+            'nodes_checked': len(node_ids),
             'skipped_existing': 0,
             'skipped_too_far': 0
         }
-
-        pairs_added = set()
         
-        # Convert max distance to approximate degrees
-        lat_avg = np.mean(coords[:, 0])
-        meters_per_degree_lat = 111320
-        meters_per_degree_lon = 111320 * np.cos(np.radians(lat_avg))
-        search_radius_degrees = self.max_walk_distance / min(meters_per_degree_lat, meters_per_degree_lon)
+        # Find every unique pair of nodes within walking distance (each pair once, i < j)
+        pairs = index.tree.query_pairs(self.max_walk_distance, output_type='ndarray')
         
-
-        #For each node, find nearby node
-        for i, node_id in enumerate(node_ids):
-            stats['nodes_checked'] += 1
-
-            #Find all nodes within search radius
-            indices = tree.query_ball_point(coords[i], search_radius_degrees)
-            
-            for j in indices:
-                if i == j:  # Skip self and already processed pairs
-                    continue
-                
-                neighbor_id = node_ids[j]
-                
-                # Calculate exact distance
-                distance = self._calculate_distance(coords[i], coords[j])
-                
-                # Check if within walking distance
-                if distance > self.max_walk_distance:
-                    stats['skipped_too_far'] += 1
-                    continue
-                
-                # Check if edge already exists
-                if self.graph.has_edge(node_id, neighbor_id):
-                    stats['skipped_existing'] += 1
-                    continue
-                
-                # Add bidirectional walking edges
-                self._add_walking_edge(node_id, neighbor_id, distance)
-                self._add_walking_edge(neighbor_id, node_id, distance)
-                
-                stats['edges_added'] += 2
-                pairs_added.add(tuple(sorted([node_id, neighbor_id])))
-                
-                # Log progress
-                if len(pairs_added) % 50 == 0:
-                    logger.info(f"   Progress: {len(pairs_added)} stop pairs connected...")
+        # Haversine distances for all pairs at once, from the index's cached radians
+        a = index.coords_rad[pairs[:, 0]]
+        b = index.coords_rad[pairs[:, 1]]
+        distances = haversine_m(a[:, 0], a[:, 1], b[:, 0], b[:, 1])
         
-        stats['unique_pairs'] = len(pairs_added)
-        return stats
-    
-    def _calculate_distance(self, coord1, coord2):
-        """Calculate geodesic distance between two coordinates"""
-        return geodesic((coord1[0], coord1[1]), (coord2[0], coord2[1])).meters
-    
-    def _add_walking_edge(self, source, target, distance):
-        """Add a single walking edge with calculated attributes"""
+        # Check if within walking distance with a single boolean mask
+        within = distances <= self.max_walk_distance
+        stats['skipped_too_far'] = int(np.count_nonzero(~within))
+        
+        # Edges left after clearing walking transfers (tram/bus/train links) must
+        # not be overwritten; a plain set makes the overlap check a hash probe
+        existing = set(self.graph.edges())
+        if not self.graph.is_directed():
+            existing.update([(v, u) for u, v in existing])
         
-        # Calculate travel time
-        travel_time = distance / self.walking_speed  # seconds
+        walking_edges = []
         
-        # Walking has zero emissions
-        emissions = 0.0
+        sources = node_ids[pairs[within, 0]].tolist()
+        targets = node_ids[pairs[within, 1]].tolist()
         
-        # Add edge
-        self.graph.add_edge(
-            source,
-            target,
-            mode='walk',
-            distance=distance,
-            time=travel_time,
-            emissions=emissions,
-            edge_type='pt_transfer',
-            walk_distance_m=round(distance, 1),
-            walk_time_min=round(travel_time / 60, 1)
-        )
+        for node_id, neighbor_id, distance in zip(sources, targets, distances[within].tolist()):
+            # Check if edge already exists
+            if (node_id, neighbor_id) in existing:
+                stats['skipped_existing'] += 1
+                continue
+            
+            # Walking time in seconds; walking has zero emissions
+            travel_time = distance / self.walking_speed
+            attrs = {
+                'mode': 'walk',
+                'distance': distance,
+                'time': travel_time,
+                'emissions': 0.0,
+                'edge_type': 'pt_transfer',
+                'walk_distance_m': round(distance, 1),
+                'walk_time_min': round(travel_time / 60, 1)
+            }
+            
+            # Bidirectional walking edges
+            walking_edges.append((node_id, neighbor_id, attrs))
+            walking_edges.append((neighbor_id, node_id, attrs))
+        
+        # Insert all walking edges in one batch
+        self.graph.add_edges_from(walking_edges)
+        stats['edges_added'] = len(walking_edges)
+        # query_pairs yields each pair once, so every pair contributed two edges
+        stats['unique_pairs'] = len(walking_edges) // 2
+        
+        return stats
     
     def _analyze_by_mode(self):
         """Analyze walking connections by transport mode"""
         
         logger.info("\n📊 Analyzing transfers by mode...")
         
-        # Categorize nodes by mode
-        node_modes = {}
-        for node in self.graph.nodes():
-            modes = set()
-            for neighbor in self.graph[node]:
-                edge = self.graph[node][neighbor]
-                mode = edge.get('mode')
-                route_type = edge.get('route_type')
-                
-                if mode and mode != 'walk':
-                    modes.add(mode)
-                elif route_type in [1, 2]:
-                    modes.add('train')
-                elif route_type == 0:
-                    modes.add('tram')
-                elif route_type == 3:
-                    modes.add('bus')
+        # Categorize nodes by mode in a single pass over the edges
+        node_modes = defaultdict(set)
+        for u, v, data in self.graph.edges(data=True):
+            mode = data.get('mode')
+            route_type = data.get('route_type')
             
-            node_modes[node] = modes
+            if mode and mode != 'walk':
+                edge_mode = mode
+            elif route_type in [1, 2]:
+                edge_mode = 'train'
+            elif route_type == 0:
+                edge_mode = 'tram'
+            elif route_type == 3:
+                edge_mode = 'bus'
+            else:
+                continue
+            
+            node_modes[u].add(edge_mode)
+            node_modes[v].add(edge_mode)
+        
+        node_modes = {node: frozenset(modes) for node, modes in node_modes.items()}
+        no_modes = frozenset()
         
         # Count transfer types
         transfer_counts = {
@@ -229,32 +198,42 @@ class PTWalkingConnectionBuilder:
             'other': 0
         }
         
+        # Only a handful of distinct mode-set pairs exist, so classify each pair once
+        transfer_types = {}
+        
         for u, v, data in self.graph.edges(data=True):
             if data.get('mode') != 'walk' or data.get('edge_type') != 'pt_transfer':
                 continue
             
-            u_modes = node_modes.get(u, set())
-            v_modes = node_modes.get(v, set())
+            key = (node_modes.get(u, no_modes), node_modes.get(v, no_modes))
+            transfer_type = transfer_types.get(key)
             
-            if 'train' in u_modes and 'train' in v_modes:
-                transfer_counts['train↔train'] += 1
-            elif ('train' in u_modes and 'tram' in v_modes) or ('tram' in u_modes and 'train' in v_modes):
-                transfer_counts['train↔tram'] += 1
-            elif ('train' in u_modes and 'bus' in v_modes) or ('bus' in u_modes and 'train' in v_modes):
-                transfer_counts['train↔bus'] += 1
-            elif 'tram' in u_modes and 'tram' in v_modes:
-                transfer_counts['tram↔tram'] += 1
-            elif ('tram' in u_modes and 'bus' in v_modes) or ('bus' in u_modes and 'tram' in v_modes):
-                transfer_counts['tram↔bus'] += 1
-            elif 'bus' in u_modes and 'bus' in v_modes:
-                transfer_counts['bus↔bus'] += 1
-            else:
-                transfer_counts['other'] += 1
+            if transfer_type is None:
+                transfer_type = transfer_types[key] = self._classify_transfer(*key)
+            
+            transfer_counts[transfer_type] += 1
         
         logger.info("\n   Transfer types:")
         for transfer_type, count in sorted(transfer_counts.items()):
             if count > 0:
                 logger.info(f"      {transfer_type:15s}: {count:,}")
+    
+    @staticmethod
+    def _classify_transfer(u_modes, v_modes):
+        """Name the transfer type between two stops given their mode sets"""
+        if 'train' in u_modes and 'train' in v_modes:
+            return 'train↔train'
+        elif ('train' in u_modes and 'tram' in v_modes) or ('tram' in u_modes and 'train' in v_modes):
+            return 'train↔tram'
+        elif ('train' in u_modes and 'bus' in v_modes) or ('bus' in u_modes and 'train' in v_modes):
+            return 'train↔bus'
+        elif 'tram' in u_modes and 'tram' in v_modes:
+            return 'tram↔tram'
+        elif ('tram' in u_modes and 'bus' in v_modes) or ('bus' in u_modes and 'tram' in v_modes):
+            return 'tram↔bus'
+        elif 'bus' in u_modes and 'bus' in v_modes:
+            return 'bus↔bus'
+        return 'other'
 
 
 def main():
@@ -267,7 +246,7 @@ def main():
     # Load PT graph
     logger.info(f"\nLoading PT graph from {PT_GRAPH_PATH}...")
     try:
-        with open(PT_GRAPH_PATH, 'rb') as f:
+        with open(PT_GRAPH_PATH, 'rb', buffering=IO_BUFFER_SIZE) as f:
             G = pickle.load(f)
         logger.info(f"✅ Loaded: {G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges")
     except FileNotFoundError:
@@ -302,8 +281,8 @@ def main():
     logger.info(f"\n💾 Saving PT graph with walking connections...")
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
-    with open(PT_GRAPH_PATH, 'wb') as f:
-        pickle.dump(G, f)
+    with open(PT_GRAPH_PATH, 'wb', buffering=IO_BUFFER_SIZE) as f:
+        pickle.dump(G, f, protocol=PICKLE_PROTOCOL)
     
     logger.info(f"✅ Saved to {PT_GRAPH_PATH}")
     
@@ -0,0 +1,87 @@
+"""
+Shared Spatial Index for Graph Nodes
+KDTree over node coordinates, memoized per graph within a process
+"""
+
+import numpy as np
+import os
+import sys
+import weakref
+from scipy.spatial import cKDTree
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connections.geo import project_to_local_xy
+
+# Each tree serves one batch of small-radius queries per run, so favour a fast
+# build over a balanced/compacted tree; re-enable both if indexes end up
+# serving many repeated queries
+KDTREE_OPTIONS = dict(leafsize=16, balanced_tree=False, compact_nodes=False)
+
+# Indexes already built in this process, keyed by the graph object itself
+_index_cache = weakref.WeakKeyDictionary()
+
+
+def node_coords(graph):
+    """(node_ids, (n, 2) lat/lon array, skipped IDs) for the nodes of a graph"""
+    node_ids = []
+    skipped = []
+    coords = np.empty((graph.number_of_nodes(), 2))
+    i = 0
+
+    for node_id, node_data in graph.nodes(data=True):
+        lat = node_data.get('lat')
+        lon = node_data.get('lon')
+
+        if lat is None or lon is None:
+            skipped.append(node_id)
+            continue
+
+        coords[i, 0] = lat
+        coords[i, 1] = lon
+        node_ids.append(node_id)
+        i += 1
+
+    return node_ids, coords[:i], skipped
+
+
+class SpatialIndex:
+    """Node IDs, lat/lon coordinates and a KDTree in a local metric frame"""
+
+    def __init__(self, node_ids, coords, skipped=()):
+        self.node_ids = node_ids
+        self.coords = coords
+        self.coords_rad = np.radians(coords)
+        self.skipped = list(skipped)
+
+        # Index in a local metric frame so tree distances are meters, not degrees
+        self.xy, self.origin = project_to_local_xy(coords)
+        self.tree = cKDTree(self.xy, **KDTREE_OPTIONS)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def project(self, coords):
+        """Project lat/lon query points into this index's metric frame"""
+        xy, _ = project_to_local_xy(coords, self.origin)
+        return xy
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Index every node with lat/lon; IDs of nodes without are kept in .skipped"""
+        node_ids, coords, skipped = node_coords(graph)
+        return cls(np.asarray(node_ids, dtype=object), coords, skipped)
+
+
+def get_spatial_index(graph):
+    """
+    Return the SpatialIndex for a graph, reusing one already built for it.
+
+    The memo is keyed on the graph object, so a hit skips the node pass
+    entirely; callers may add or remove edges (as pt_to_pt.py does with the
+    walking transfers) but must not move nodes while the index is in use.
+    """
+    index = _index_cache.get(graph)
+    if index is None:
+        index = SpatialIndex.from_graph(graph)
+        _index_cache[graph] = index
+    return index
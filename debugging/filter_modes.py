@@ -1,24 +1,56 @@
 import networkx as nx
+import numpy as np
 import pickle
 import os
 import sys
+from math import radians, sin, cos, sqrt, atan2
+from numba import njit
 
 # ============================================================
 # SETUP
 # ============================================================
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config_integration import COMBINED_GRAPH_PATH
+from config_integration import COMBINED_GRAPH_PATH, IO_BUFFER_SIZE
+from connections.spatial_index import SpatialIndex
 
 # Load the graph
-with open(COMBINED_GRAPH_PATH, 'rb') as f:
+with open(COMBINED_GRAPH_PATH, 'rb', buffering=IO_BUFFER_SIZE) as f:
     G = pickle.load(f)
 
 print(f"📊 Original graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
 print(f"📋 Graph type: {type(G)}")
 
+# Spatial index over node coordinates (local metric frame, so radius is meters)
+index = SpatialIndex.from_graph(G)
+
 # ============================================================
 # NODE COMPATIBILITY FUNCTION
 # ============================================================
+# Node ID prefix -> node kind (checked in order)
+NODE_KIND_PREFIXES = (
+    ('road_', 'car'),
+    ('train_', 'train'),
+    ('tram_', 'tram'),
+    ('bus_', 'bus'),
+    ('pt_', 'pt'),
+)
+
+# Modes that make each node kind usable
+KIND_COMPATIBLE_MODES = {
+    'car': frozenset({'car'}),  # Road nodes ONLY for car mode (not for walking between public transport)
+    'train': frozenset({'train'}),
+    'tram': frozenset({'tram'}),
+    'bus': frozenset({'bus'}),
+    'pt': frozenset({'train', 'tram', 'bus', 'walk'}),  # PT nodes work with any public transport mode
+}
+
+def classify_node(node):
+    """Return the node kind implied by its ID prefix ('other' if unknown)"""
+    return next((kind for prefix, kind in NODE_KIND_PREFIXES if node.startswith(prefix)), 'other')
+
+# Classify every node once so compatibility checks are a dict lookup
+node_kinds = {node: classify_node(node) for node in G.nodes()}
+
 def is_node_compatible(node, mode_filter=None):
     """
     Check if a node is compatible with the given mode filter
@@ -26,30 +58,27 @@ def is_node_compatible(node, mode_filter=None):
     if mode_filter is None:
         return True
     
-    # Check node type compatibility with STRICTER logic
-    if node.startswith('road_'):
-        # Road nodes ONLY for car mode (not for walking between public transport)
-        return 'car' in mode_filter
-    elif node.startswith('train_'):
-        return 'train' in mode_filter
-    elif node.startswith('tram_'):
-        return 'tram' in mode_filter
-    elif node.startswith('bus_'):
-        return 'bus' in mode_filter
-    elif node.startswith('pt_'):  # Public transport nodes
-        # PT nodes should work with any public transport mode
-        return any(mode in mode_filter for mode in ['train', 'tram', 'bus', 'walk'])
+    kind = node_kinds.get(node) or classify_node(node)
     
     # Default: allow unknown node types
-    return True
+    if kind == 'other':
+        return True
+    
+    return not KIND_COMPATIBLE_MODES[kind].isdisjoint(mode_filter)
 
 # ============================================================
 # FIXED FILTER GRAPH FUNCTION
 # ============================================================
-def filter_graph_by_modes(graph, enabled_modes):
+def filter_graph_by_modes(graph, enabled_modes, copy=False):
     """
     Filter graph to only include edges with allowed transport modes
+
+    Returns a read-only view by default (no nodes or edges are copied);
+    pass copy=True for an independent graph that callers can mutate.
     """
+    if not copy:
+        return _filtered_view(graph, enabled_modes)
+    
     filtered_graph = nx.Graph() if isinstance(graph, nx.Graph) else nx.MultiDiGraph()
     
     # Add compatible nodes
@@ -76,6 +105,26 @@ def filter_graph_by_modes(graph, enabled_modes):
     
     return filtered_graph
 
+def _filtered_view(graph, enabled_modes):
+    """Lazy equivalent of filter_graph_by_modes using nx.subgraph_view"""
+    def filter_node(node):
+        return is_node_compatible(node, enabled_modes)
+    
+    if graph.is_multigraph():
+        def filter_edge(u, v, key):
+            return graph[u][v][key].get('mode', '') in enabled_modes
+    else:
+        def filter_edge(u, v):
+            return graph[u][v].get('mode', '') in enabled_modes
+    
+    view = nx.subgraph_view(graph, filter_node=filter_node, filter_edge=filter_edge)
+    
+    # The copy variant always builds an undirected graph, so match it here
+    if view.is_directed():
+        view = view.to_undirected(as_view=True)
+    
+    return view
+
 # ============================================================
 # TEST DIFFERENT MODE COMBINATIONS
 # ============================================================
@@ -128,30 +177,40 @@ for modes in test_cases:
 # ============================================================
 # CHECK CANDIDATE NODES FOR SPECIFIC COORDINATES
 # ============================================================
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculate Haversine distance between two points in km"""
-    from math import radians, sin, cos, sqrt, atan2
+@njit(cache=True, fastmath=True)
+def _hav_many(lat0, lon0, lats, lons):
+    """Haversine distance in km from (lat0, lon0) to every point in lats/lons"""
     R = 6371  # Earth radius in km
     
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
+    lat0 = radians(lat0)
+    lon0 = radians(lon0)
+    distances = np.empty(lats.shape[0])
     
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    for i in range(lats.shape[0]):
+        lat = radians(lats[i])
+        dlat = lat - lat0
+        dlon = radians(lons[i]) - lon0
+        
+        a = sin(dlat/2)**2 + cos(lat0) * cos(lat) * sin(dlon/2)**2
+        distances[i] = R * 2 * atan2(sqrt(a), sqrt(1-a))
     
-    return R * c
+    return distances
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Calculate Haversine distance between two points in km"""
+    return _hav_many(lat1, lon1, np.array([lat2], dtype=np.float64), np.array([lon2], dtype=np.float64))[0]
 
 def find_candidate_nodes(lat, lon, mode_filter=None, max_distance_km=0.5, max_candidates=5):
     """Find candidate nodes for given coordinates"""
     candidates = []
     
-    for node, data in G.nodes(data=True):
-        if 'lat' not in data or 'lon' not in data:
-            continue
-        
-        distance = haversine_distance(lat, lon, data['lat'], data['lon'])
-        
+    point_m = index.project([[lat, lon]])[0]
+    indices = np.asarray(index.tree.query_ball_point(point_m, max_distance_km * 1000), dtype=np.intp)
+    
+    # Exact distances for every hit in one compiled pass
+    distances = _hav_many(lat, lon, index.coords[indices, 0], index.coords[indices, 1])
+    
+    for node, distance in zip(index.node_ids[indices], distances):
         if distance <= max_distance_km:
             if is_node_compatible(node, mode_filter):
                 candidates.append((node, distance))
@@ -1,4 +1,5 @@
 import networkx as nx
+import functools
 import logging
 import sys
 import pickle
@@ -16,16 +17,36 @@ logging.basicConfig(
 # ============================================================
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config_integration import COMBINED_GRAPH_PATH, LOG_LEVEL, LOG_FORMAT
+from config_integration import COMBINED_GRAPH_PATH, LOG_LEVEL, LOG_FORMAT, IO_BUFFER_SIZE
+from graph_integration.dijkstra_numba import CSRGraph
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
-with open(COMBINED_GRAPH_PATH, 'rb') as f:
+with open(COMBINED_GRAPH_PATH, 'rb', buffering=IO_BUFFER_SIZE) as f:
         G = pickle.load(f)
 
 logging.info(f"✅ Loaded graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
 
+# Some edges (like connection edges) don't have 'weight'; fall back to travel
+# time once here so every edge carries a plain float weight
+edge_weight = {
+    (u, v): float(d.get("weight", d.get("time", 1.0)))
+    for u, v, d in G.edges(data=True)
+}
+nx.set_edge_attributes(G, edge_weight, "weight")
+
+# Modes fetched once for printing paths, rather than probing G[u][v] per hop
+edge_mode = nx.get_edge_attributes(G, "mode")
+
+# Flat CSR copy of the graph for the numba pathfinder
+csr = CSRGraph.from_graph(G, weight="weight")
+
+@functools.lru_cache(maxsize=1024)
+def cached_sp(source, target):
+    """(total weight, path) for a query; repeats in the session are answered from cache"""
+    return csr.shortest_path(source, target)
+
 # ============================================================
 # MAIN INTERACTIVE LOOP
 # ============================================================
@@ -45,27 +66,17 @@ while True:
 
     print("\nFinding path...")
     try:
-        path = nx.shortest_path(G, source=source, target=target, weight="weight")
-        total_weight = nx.shortest_path_length(G, source=source, target=target, weight="weight")
+        total_weight, path = cached_sp(source, target)
 
         print("\n✅ Path found!")
         print(f"→ Path length (weighted): {total_weight:.2f}")
         print(f"→ Number of hops: {len(path) - 1}\n")
 
         # Display a compact summary of the path
-        for i in range(len(path) - 1):
-            u, v = path[i], path[i + 1]
-            edge_data = G[u][v]
-            mode = edge_data.get("mode", "unknown")
-
-            # Some edges (like connection edges) might not have 'weight'
-            weight = edge_data.get("weight", None)
-            if isinstance(weight, (int, float)):
-                weight_str = f"{weight:.1f}"
-            else:
-                weight_str = "?"
-
-            print(f"{u} --[{mode}, {weight_str}]--> {v}")
+        for u, v in zip(path, path[1:]):
+            mode = edge_mode.get((u, v), "unknown")
+
+            print(f"{u} --[{mode}, {edge_weight[(u, v)]:.1f}]--> {v}")
 
     except nx.NetworkXNoPath:
         print("❌ No path found between those nodes.")
@@ -1,26 +1,47 @@
 import networkx as nx
+import numpy as np
 import pickle
 import os
 import sys
+from collections import defaultdict
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 
 # ============================================================
 # SETUP
 # ============================================================
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config_integration import COMBINED_GRAPH_PATH
+from config_integration import COMBINED_GRAPH_PATH, IO_BUFFER_SIZE
+from graph_integration.build_ch import get_contraction_hierarchy
+from graph_integration.graph_cache import get_graph
+from graph_integration.graph_io import MODE_CODES, NODE_TYPE_CODES
 
 # Load the graph
-with open(COMBINED_GRAPH_PATH, 'rb') as f:
+with open(COMBINED_GRAPH_PATH, 'rb', buffering=IO_BUFFER_SIZE) as f:
     G_combined = pickle.load(f)
 
-# Test if walking edges between PT nodes exist in combined graph
-walking_edges_found = 0
+# Point-to-point queries on 'time' go through the contraction hierarchy
+ch = get_contraction_hierarchy(G_combined)
+
+# Edge lookups below are set probes rather than has_edge calls
+edge_set = set(G_combined.edges())
+
+# Index edges by mode and edge type in a single pass; the checks below
+# read these lists instead of rescanning every edge
+by_mode = defaultdict(list)
+by_type = defaultdict(list)
 for u, v, data in G_combined.edges(data=True):
-    if (data.get('mode') == 'walk' and 
-        data.get('edge_type') == 'pt_transfer' and
-        not u.startswith('road_') and 
-        not v.startswith('road_')):
-        walking_edges_found += 1
+    by_mode[data.get('mode')].append((u, v))
+    by_type[data.get('edge_type')].append((u, v))
+
+walk_edges = set(by_mode['walk'])
+walking_transfers = [e for e in by_type['pt_transfer'] if e in walk_edges]
+
+# Test if walking edges between PT nodes exist in combined graph
+walking_edges_found = sum(
+    1 for u, v in walking_transfers
+    if not u.startswith('road_') and not v.startswith('road_')
+)
 
 print(f"PT-to-PT walking edges in combined graph: {walking_edges_found}")
 
@@ -29,76 +50,65 @@ start_candidates = ['pt_46882', 'pt_20569', 'pt_20567', 'pt_20566', 'pt_20570']
 dest_candidates = ['pt_20562', 'pt_20563', 'pt_19450', 'pt_20561', 'pt_19302']
 
 print("Testing walking paths between specific candidates:")
+paths_found = 0
 for start in start_candidates:
     for dest in dest_candidates:
-        if G_combined.has_edge(start, dest):
+        if (start, dest) in edge_set:
             edge_data = G_combined[start][dest]
             if edge_data.get('mode') == 'walk':
                 print(f"✅ DIRECT walking edge: {start} -> {dest}")
         
         # Check if any path exists (not just direct edge)
         try:
-            path = nx.shortest_path(G_combined, start, dest, weight='time')
+            _, path = ch.query(start, dest)
             print(f"✅ PATH exists: {start} -> {dest} (via {len(path)} nodes)")
+            paths_found += 1
         except nx.NetworkXNoPath:
             print(f"❌ NO PATH: {start} -> {dest}")
         except Exception as e:
             print(f"⚠️ ERROR: {start} -> {dest}: {e}")
 
-# Get all PT nodes
-pt_nodes = [n for n in G_combined.nodes() if not str(n).startswith('road_')]
-
-# Create subgraph of just PT nodes and walking edges
-pt_subgraph = G_combined.subgraph(pt_nodes).copy()
-walking_edges = [(u, v) for u, v, d in pt_subgraph.edges(data=True) if d.get('mode') == 'walk']
-pt_walking_graph = pt_subgraph.edge_subgraph(walking_edges)
+print(f"\nTotal paths found: {paths_found}/25")
 
-print(f"PT walking network: {pt_walking_graph.number_of_nodes()} nodes, {pt_walking_graph.number_of_edges()} edges")
-print(f"Connected components: {nx.number_connected_components(pt_walking_graph.to_undirected())}")
+# PT walking network from the binary arrays: mask the CSR edges down to
+# walking edges between PT nodes instead of copying subgraphs
+graph = get_graph()
+n_nodes = len(graph.node_ids)
+is_pt = graph.node_types == NODE_TYPE_CODES['pt_stop']
+sources = np.repeat(np.arange(n_nodes), np.diff(graph.indptr))
+
+walking = (graph.modes == MODE_CODES['walk']) & is_pt[sources] & is_pt[graph.indices]
+walk_src = sources[walking]
+walk_dst = graph.indices[walking]
+pt_walking_graph = csr_matrix(
+    (np.ones(len(walk_src), dtype=np.int8), (walk_src, walk_dst)), shape=(n_nodes, n_nodes)
+)
+
+# Only nodes touching a walking edge belong to the network (as with edge_subgraph)
+in_network = np.zeros(n_nodes, dtype=bool)
+in_network[walk_src] = True
+in_network[walk_dst] = True
+_, labels = connected_components(pt_walking_graph, directed=False)
+
+print(f"PT walking network: {np.count_nonzero(in_network)} nodes, {len(walk_src)} edges")
+print(f"Connected components: {len(np.unique(labels[in_network]))}")
 
 # Count how many walking edges are bidirectional
-bidirectional_count = 0
-for u, v, data in G_combined.edges(data=True):
-    if (data.get('mode') == 'walk' and 
-        data.get('edge_type') == 'pt_transfer' and
-        G_combined.has_edge(v, u)):
-        bidirectional_count += 1
+bidirectional_count = sum(1 for u, v in walking_transfers if (v, u) in edge_set)
 
 print(f"Bidirectional walking edges: {bidirectional_count}")
 
-# Test the specific candidate nodes again
-start_candidates = ['pt_46882', 'pt_20569', 'pt_20567', 'pt_20566', 'pt_20570']
-dest_candidates = ['pt_20562', 'pt_20563', 'pt_19450', 'pt_20561', 'pt_19302']
-
-print("Testing walking paths between specific candidates:")
-paths_found = 0
-for start in start_candidates:
-    for dest in dest_candidates:
-        try:
-            path = nx.shortest_path(G_combined, start, dest, weight='time')
-            print(f"✅ PATH exists: {start} -> {dest}")
-            paths_found += 1
-        except nx.NetworkXNoPath:
-            print(f"❌ NO PATH: {start} -> {dest}")
-
-print(f"\nTotal paths found: {paths_found}/25")
-
 # Check bidirectionality for different transport modes
 print("Checking bidirectionality by mode:")
 modes_to_check = ['tram', 'bus', 'train']
 
 for mode in modes_to_check:
-    mode_edges = []
+    mode_edges = by_mode[mode]
     bidirectional_count = 0
     
-    # Count edges for this mode
-    for u, v, data in G_combined.edges(data=True):
-        if data.get('mode') == mode:
-            mode_edges.append((u, v))
-    
     # Check bidirectionality
     for u, v in mode_edges:
-        if G_combined.has_edge(v, u):
+        if (v, u) in edge_set:
             bidirectional_count += 1
     
     print(f"  {mode}: {len(mode_edges)} edges, {bidirectional_count} bidirectional ({bidirectional_count/len(mode_edges)*100:.1f}%)")
@@ -106,14 +116,14 @@ for mode in modes_to_check:
 # Also check specific tram/bus routes
 print("\nChecking specific transport routes:")
 transport_edges_found = 0
-for u, v, data in G_combined.edges(data=True):
-    if data.get('mode') in ['tram', 'bus', 'train']:
+for mode in ['tram', 'bus', 'train']:
+    for u, v in by_mode[mode]:
         transport_edges_found += 1
-        if not G_combined.has_edge(v, u):
-            print(f"  ❌ UNIDIRECTIONAL: {u} --[{data.get('mode')}]--> {v}")
+        if (v, u) not in edge_set:
+            print(f"  ❌ UNIDIRECTIONAL: {u} --[{mode}]--> {v}")
         else:
             reverse_data = G_combined[v][u]
-            if reverse_data.get('mode') == data.get('mode'):
-                print(f"  ✅ BIDIRECTIONAL: {u} <--[{data.get('mode')}]--> {v}")
+            if reverse_data.get('mode') == mode:
+                print(f"  ✅ BIDIRECTIONAL: {u} <--[{mode}]--> {v}")
 
 print(f"\nTotal transport edges found: {transport_edges_found}")
\ No newline at end of file
@@ -1,37 +1,41 @@
-import networkx as nx
-import pickle
-import networkx as nx
+import numpy as np
 import random
 import logging
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config_integration import COMBINED_GRAPH_PATH, LOG_LEVEL, LOG_FORMAT
+from config_integration import LOG_LEVEL, LOG_FORMAT
+from graph_integration.build_ch import get_contraction_hierarchy, query_pairs
+from graph_integration.graph_cache import get_graph
+from graph_integration.graph_io import count_codes, MODE_NAMES
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
-with open(COMBINED_GRAPH_PATH, 'rb') as f:
-        G = pickle.load(f)
+graph = get_graph()
+n_nodes = len(graph.node_ids)
 
-print(f"Nodes: {G.number_of_nodes()}")
-print(f"Edges: {G.number_of_edges()}")
-
-modes = {}
-for _, data in G.nodes(data=True):
-    mode = data.get("mode", "unknown")
-    modes[mode] = modes.get(mode, 0) + 1
+print(f"Nodes: {n_nodes}")
+print(f"Edges: {len(graph.indices)}")
 
+modes = count_codes(graph.node_modes, MODE_NAMES)
 print("Node modes:", modes)
-isolated = list(nx.isolates(G))
+
+# Isolated nodes have neither outgoing (CSR row) nor incoming (target) edges
+out_degree = np.diff(graph.indptr)
+in_degree = np.bincount(graph.indices, minlength=n_nodes)
+isolated = np.flatnonzero((out_degree == 0) & (in_degree == 0))
 print(f"Isolated nodes: {len(isolated)}")
 
-nodes = list(G.nodes)
-for i in range(5):
-    src, dst = random.sample(nodes, 2)
-    try:
-        path = nx.shortest_path(G, src, dst, weight="time")
-        logging.info(f"✅ Path {i+1}: {src} → {dst} ({len(path)} hops)")
-    except nx.NetworkXNoPath:
-        logging.warning(f"⚠️ No path between {src} and {dst}")
\ No newline at end of file
+if __name__ == "__main__":
+    # Loaded from its on-disk cache; the pickled graph is only read if it needs rebuilding
+    get_contraction_hierarchy()
+
+    nodes = graph.node_ids.tolist()
+    pairs = [random.sample(nodes, 2) for _ in range(5)]
+    for i, (src, dst, path) in enumerate(query_pairs(pairs)):
+        if path is None:
+            logging.warning(f"⚠️ No path between {src} and {dst}")
+        else:
+            logging.info(f"✅ Path {i+1}: {src} → {dst} ({len(path)} hops)")
\ No newline at end of file
@@ -1,30 +1,27 @@
-import pickle
-import networkx as nx
+import numpy as np
 import os
 import logging
 import sys
+from scipy.sparse.csgraph import connected_components
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config_integration import COMBINED_GRAPH_PATH, LOG_LEVEL, LOG_FORMAT
+from config_integration import COMBINED_GRAPH_BIN_PATH, LOG_LEVEL, LOG_FORMAT
+from graph_integration.graph_cache import get_graph
+from graph_integration.graph_io import adjacency_matrix, count_codes, MODE_NAMES, EDGE_TYPE_NAMES
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
 def load_graph():
-    logger.info(f"Loading graph from {COMBINED_GRAPH_PATH}...")
-    with open(COMBINED_GRAPH_PATH, 'rb') as f:
-        G = pickle.load(f)
-    logger.info(f"✅ Loaded: {G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges")
-    return G
+    logger.info(f"Loading graph from {COMBINED_GRAPH_BIN_PATH}...")
+    graph = get_graph()
+    logger.info(f"✅ Loaded: {len(graph.node_ids):,} nodes, {len(graph.indices):,} edges")
+    return graph
 
-def verify_nodes(G):
+def verify_nodes(graph):
     logger.info("\n🔍 Checking node attributes...")
-    missing_latlon = [n for n, d in G.nodes(data=True) if 'lat' not in d or 'lon' not in d]
-    mode_types = {}
-
-    for n, d in G.nodes(data=True):
-        mode = d.get('mode', 'unknown')
-        mode_types[mode] = mode_types.get(mode, 0) + 1
+    missing_latlon = graph.node_ids[np.isnan(graph.coords).any(axis=1)].tolist()
+    mode_types = count_codes(graph.node_modes, MODE_NAMES)
 
     logger.info(f"Node mode breakdown:")
     for mode, count in mode_types.items():
@@ -34,20 +31,13 @@ def verify_nodes(G):
     if len(missing_latlon) < 10:
         logger.info(f"Examples: {missing_latlon}")
 
-def verify_edges(G):
+def verify_edges(graph):
     logger.info("\n🔍 Checking edge attributes...")
-    missing_distance = [e for e in G.edges(data=True) if 'distance' not in e[2]]
-    missing_mode = [e for e in G.edges(data=True) if 'mode' not in e[2]]
-
-    mode_counts = {}
-    edge_types = {}
-
-    for u, v, data in G.edges(data=True):
-        mode = data.get('mode', 'unknown')
-        mode_counts[mode] = mode_counts.get(mode, 0) + 1
+    missing_distance = np.count_nonzero(np.isnan(graph.distance))
+    missing_mode = np.count_nonzero(graph.modes == -1)
 
-        edge_type = data.get('edge_type', 'standard')
-        edge_types[edge_type] = edge_types.get(edge_type, 0) + 1
+    mode_counts = count_codes(graph.modes, MODE_NAMES)
+    edge_types = count_codes(graph.edge_types, EDGE_TYPE_NAMES, missing='standard')
 
     logger.info(f"Edge mode breakdown:")
     for mode, count in mode_counts.items():
@@ -57,28 +47,29 @@ def verify_edges(G):
     for e_type, count in edge_types.items():
         logger.info(f"  {e_type:<15}: {count:,}")
 
-    logger.info(f"Edges missing distance: {len(missing_distance):,}")
-    logger.info(f"Edges missing mode: {len(missing_mode):,}")
+    logger.info(f"Edges missing distance: {missing_distance:,}")
+    logger.info(f"Edges missing mode: {missing_mode:,}")
 
-def check_connectivity(G):
+def check_connectivity(graph):
     logger.info("\n🔍 Checking graph connectivity...")
-    if nx.is_connected(G.to_undirected()):
+    # One C pass over the CSR edges, treating them as undirected
+    components, labels = connected_components(adjacency_matrix(graph), directed=False)
+    if components == 1:
         logger.info("✅ Graph is fully connected.")
     else:
-        components = nx.number_connected_components(G.to_undirected())
         logger.warning(f"⚠️ Graph is NOT fully connected — {components} components found.")
-        largest_cc = max(nx.connected_components(G.to_undirected()), key=len)
-        logger.info(f"Largest component: {len(largest_cc):,} nodes")
+        largest_cc = np.bincount(labels).max()
+        logger.info(f"Largest component: {largest_cc:,} nodes")
 
 def main():
     logger.info("="*60)
     logger.info("GRAPH INTEGRITY CHECK")
     logger.info("="*60)
 
-    G = load_graph()
-    verify_nodes(G)
-    verify_edges(G)
-    check_connectivity(G)
+    graph = load_graph()
+    verify_nodes(graph)
+    verify_edges(graph)
+    check_connectivity(graph)
 
     logger.info("\n✅ Verification complete.\n")
 
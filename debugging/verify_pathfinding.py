@@ -1,48 +1,72 @@
-import pickle
 import networkx as nx
+import numpy as np
 import random
 import logging
 import sys
 import os
+from scipy.sparse.csgraph import connected_components
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config_integration import COMBINED_GRAPH_PATH, LOG_LEVEL, LOG_FORMAT
+from config_integration import LOG_LEVEL, LOG_FORMAT
+from graph_integration.build_ch import get_contraction_hierarchy, query_pairs
+from graph_integration.graph_cache import get_graph
+from graph_integration.graph_io import adjacency_matrix, path_edges, MODE_NAMES
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
 def load_graph():
-    with open(COMBINED_GRAPH_PATH, 'rb') as f:
-        G = pickle.load(f)
-    logger.info(f"✅ Loaded: {G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges")
-    return G
+    """Memory-mapped binary graph; no per-edge attribute dicts are unpickled"""
+    graph = get_graph()
+    logger.info(f"✅ Loaded: {len(graph.node_ids):,} nodes, {len(graph.indices):,} edges")
+    return graph
 
-def test_random_paths(G, n_tests=5):
+def load_component_labels(graph):
+    """Weakly connected component label of each node in the binary graph"""
+    _, labels = connected_components(adjacency_matrix(graph), directed=False)
+    return labels
+
+def test_random_paths(graph, id_of, labels, n_tests=5):
     logger.info(f"\n🚦 Running {n_tests} random pathfinding tests...")
 
-    nodes = list(G.nodes())
-    for i in range(n_tests):
-        src, dst = random.sample(nodes, 2)
-        try:
-            path = nx.shortest_path(G, src, dst, weight='time')
-            total_time = sum(G[u][v].get('time', 0) for u, v in zip(path[:-1], path[1:]))
-            modes_used = set(G[u][v].get('mode', 'unknown') for u, v in zip(path[:-1], path[1:]))
-            logger.info(f"Path {i+1}: {src} → {dst}")
-            logger.info(f"  Length: {len(path)} hops")
-            logger.info(f"  Total time: {total_time/60:.1f} min")
-            logger.info(f"  Modes used: {', '.join(modes_used)}\n")
-        except nx.NetworkXNoPath:
+    # Sample node indices into the binary graph rather than listing every node ID
+    node_ids = graph.node_ids
+    pairs = [random.sample(range(len(node_ids)), 2) for _ in range(n_tests)]
+
+    # Nodes in different components can't be connected, skip the search
+    reachable = [(str(node_ids[s]), str(node_ids[t])) for s, t in pairs if labels[s] == labels[t]]
+    paths = {(src, dst): path for src, dst, path in query_pairs(reachable)}
+
+    for i, (s, t) in enumerate(pairs):
+        src, dst = str(node_ids[s]), str(node_ids[t])
+        if (src, dst) not in paths:
+            logger.warning(f"⚠️ No path between {src} and {dst} (different components)")
+            continue
+
+        path = paths[src, dst]
+        if path is None:
             logger.warning(f"⚠️ No path between {src} and {dst}")
+            continue
+
+        edges = path_edges(graph, id_of, path)
+        total_time = np.nansum(graph.time[edges])
+        modes_used = set(MODE_NAMES.get(code, 'unknown') for code in graph.modes[edges].tolist())
+        logger.info(f"Path {i+1}: {src} → {dst}")
+        logger.info(f"  Length: {len(path)} hops")
+        logger.info(f"  Total time: {total_time/60:.1f} min")
+        logger.info(f"  Modes used: {', '.join(modes_used)}\n")
 
-def test_specific_path(G, src, dst):
+def test_specific_path(graph, id_of, ch, src, dst):
     """Test a known path (for example Burnley → Box Hill)"""
     logger.info(f"\n🧭 Testing specific path: {src} → {dst}")
     try:
-        path = nx.shortest_path(G, src, dst, weight='time')
+        _, path = ch.query(src, dst)
         logger.info(f"✅ Found path ({len(path)} steps)")
+        edges = path_edges(graph, id_of, path)
+        modes = graph.modes[edges].tolist()
+        distances = np.nan_to_num(graph.distance[edges]).tolist()
         for i, (u, v) in enumerate(zip(path[:-1], path[1:])):
-            edge = G[u][v]
-            logger.info(f"  {i+1}. {u} → {v} [{edge.get('mode')}] {edge.get('distance', 0):.1f}m")
+            logger.info(f"  {i+1}. {u} → {v} [{MODE_NAMES.get(modes[i])}] {distances[i]:.1f}m")
     except nx.NetworkXNoPath:
         logger.warning("⚠️ No path found!")
 
@@ -51,10 +75,15 @@ def main():
     logger.info("PATHFINDING VERIFICATION")
     logger.info("="*60)
 
-    G = load_graph()
-    test_random_paths(G)
+    graph = load_graph()
+    id_of = {node_id: i for i, node_id in enumerate(graph.node_ids.tolist())}
+
+    # The pickled graph is only read if the hierarchy needs rebuilding
+    ch = get_contraction_hierarchy()
+    labels = load_component_labels(graph)
+    test_random_paths(graph, id_of, labels)
     # Replace with known nodes from your corridor
-    # test_specific_path(G, "burnley_station_id", "box_hill_station_id")
+    # test_specific_path(graph, id_of, ch, "burnley_station_id", "box_hill_station_id")
 
     logger.info("\n✅ Pathfinding tests complete.\n")
 
@@ -1,5 +1,6 @@
 import networkx as nx
 import folium
+import functools
 import logging
 import pickle
 import sys
@@ -7,12 +8,13 @@ import os
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config_integration import COMBINED_GRAPH_PATH
+from config_integration import COMBINED_GRAPH_PATH, IO_BUFFER_SIZE
+from graph_integration.dijkstra_numba import CSRGraph
 
 GRAPH_PATH = "data/graphs/merged_graph.gpickle"
-with open(COMBINED_GRAPH_PATH, 'rb') as f:
+with open(COMBINED_GRAPH_PATH, 'rb', buffering=IO_BUFFER_SIZE) as f:
         G = pickle.load(f)
-logging.info(f"✅ Loaded graph with {len(G.nodes())} nodes, {len(G.edges())} edges")
+logging.info(f"✅ Loaded graph with {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
 
 def visualize_path(G, path, filename="specific_route.html"):
     # Try to extract lat/lon from node attributes
@@ -39,6 +41,21 @@ def visualize_path(G, path, filename="specific_route.html"):
     m.save(filename)
     logging.info(f"🗺️ Route visual saved as {filename}")
 
+# Create green cost once up front rather than rescanning every edge per query
+for u, v, data in G.edges(data=True):
+    if "green_cost" not in data:
+        data["green_cost"] = 1 / (data.get("green_score", 1e-6))
+
+# CSR copies of the graph for the numba pathfinder, one per routing weight
+csr_by_weight = {}
+
+@functools.lru_cache(maxsize=1024)
+def cached_sp(start, end, weight):
+    """(total, path) for a query; repeats in the session are answered from cache"""
+    if weight not in csr_by_weight:
+        csr_by_weight[weight] = CSRGraph.from_graph(G, weight)
+    return csr_by_weight[weight].shortest_path(start, end)
+
 while True:
     print("\n=== PATH FINDER ===")
     start = input("Enter START node ID (or 'exit' to quit): ").strip()
@@ -54,19 +71,13 @@ while True:
     try:
         if mode == "greenest":
             weight = "emissions"
-            # create cost if not already defined
-            for u, v, data in G.edges(data=True):
-                if "green_cost" not in data:
-                    data["green_cost"] = 1 / (data.get("green_score", 1e-6))
         else:
             weight = "length"
 
-        path = nx.shortest_path(G, start, end, weight=weight)
-        total = nx.shortest_path_length(G, start, end, weight=weight)
+        total, path = cached_sp(start, end, weight)
 
         print(f"\n✅ Path found ({mode}): total cost = {total:.2f}")
-        for i in range(len(path)-1):
-            u, v = path[i], path[i+1]
+        for u, v in zip(path, path[1:]):
             data = G[u][v]
             mode = data.get("mode", "?")
             cost = data.get(weight, "?")
@@ -0,0 +1,404 @@
+"""
+Contraction Hierarchy for the Combined Graph
+Preprocesses the graph once so point-to-point queries on 'time' run as a
+small bidirectional upward search instead of a full Dijkstra
+"""
+
+import networkx as nx
+import numpy as np
+import heapq
+import pickle
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_integration import (
+    COMBINED_GRAPH_PATH, COMBINED_CH_PATH, OUTPUT_DIR,
+    CH_WITNESS_SETTLE_LIMIT, CH_CORE_DEGREE, LOG_LEVEL, LOG_FORMAT,
+    IO_BUFFER_SIZE, PICKLE_PROTOCOL
+)
+from graph_integration.dijkstra_numba import ch_query_csr, weight_scale, to_fixed_point
+
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+logger = logging.getLogger(__name__)
+
+INF = float('inf')
+
+# Hierarchies already built or loaded in this process, keyed by (graph path, mtime)
+_ch_cache = {}
+
+
+def graph_to_arrays(G, weight='time'):
+    """
+    Flatten a graph into dense integer IDs and (src, dst, weight) edge arrays.
+
+    Node i of the arrays is node_ids[i]; edges missing the weight attribute
+    count as 1, matching NetworkX's shortest path default. Edges of an
+    undirected G are emitted in both directions.
+    """
+    node_ids = list(G.nodes())
+    id_of = {node_id: i for i, node_id in enumerate(node_ids)}
+
+    n_edges = G.number_of_edges()
+    src = np.empty(n_edges, dtype=np.uint32)
+    dst = np.empty(n_edges, dtype=np.uint32)
+    weights = np.empty(n_edges, dtype=np.float64)
+
+    for i, (u, v, w) in enumerate(G.edges(data=weight, default=1)):
+        src[i] = id_of[u]
+        dst[i] = id_of[v]
+        weights[i] = w
+
+    # Undirected graphs list each edge once; add the reverse arcs
+    if not G.is_directed():
+        src, dst = np.concatenate([src, dst]), np.concatenate([dst, src])
+        weights = np.concatenate([weights, weights])
+
+    return node_ids, id_of, src, dst, weights
+
+
+def _to_csr(n_nodes, adjacency):
+    """Pack a list of {neighbor: weight} dicts into int32/uint32 CSR arrays"""
+    indptr = np.zeros(n_nodes + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum([len(neighbors) for neighbors in adjacency])
+
+    indices = np.fromiter(
+        (w for neighbors in adjacency for w in neighbors), dtype=np.int32, count=indptr[-1]
+    )
+    weights = np.fromiter(
+        (c for neighbors in adjacency for c in neighbors.values()), dtype=np.uint32, count=indptr[-1]
+    )
+    return indptr, indices, weights
+
+
+class ContractionHierarchy:
+    """
+    Upward/downward search graphs of a contracted graph plus the middle node
+    of every shortcut, so paths can be unpacked back to original edges.
+    """
+
+    def __init__(self, node_ids, rank, up, down, via, weight_scale):
+        self.node_ids = node_ids
+        self.id_of = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.rank = rank
+        self.weight_scale = weight_scale
+
+        # Forward search follows up edges (v -> higher w); backward search
+        # follows down edges reversed (v <- higher u)
+        self.up_indptr, self.up_indices, self.up_weights = up
+        self.down_indptr, self.down_indices, self.down_weights = down
+        self.via = via
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @classmethod
+    def from_graph(cls, G, weight='time', settle_limit=CH_WITNESS_SETTLE_LIMIT,
+                   core_degree=CH_CORE_DEGREE):
+        """Contract the nodes of G in edge-difference order, leaving a dense core"""
+        node_ids, _, src, dst, weights = graph_to_arrays(G, weight)
+        n = len(node_ids)
+
+        # Contract on fixed-point integers so shortcut costs add up exactly
+        scale = weight_scale(weight)
+        weights = to_fixed_point(weights, scale)
+
+        out_adj = [{} for _ in range(n)]
+        in_adj = [{} for _ in range(n)]
+        for u, v, w in zip(src.tolist(), dst.tolist(), weights.tolist()):
+            if u != v:
+                out_adj[u][v] = w
+                in_adj[v][u] = w
+
+        builder = _Contractor(out_adj, in_adj, settle_limit, core_degree)
+        rank, up, down, via = builder.run()
+
+        return cls(node_ids, rank, _to_csr(n, up), _to_csr(n, down), via, scale)
+
+    def query(self, source, target):
+        """
+        Shortest (length, path) from source to target on the hierarchy's weight.
+
+        Raises nx.NodeNotFound for unknown nodes and nx.NetworkXNoPath when
+        target is unreachable, like nx.shortest_path.
+        """
+        for node in (source, target):
+            if node not in self.id_of:
+                raise nx.NodeNotFound(f"Node {node} not in graph")
+
+        s = self.id_of[source]
+        t = self.id_of[target]
+        if s == t:
+            return 0.0, [source]
+
+        best, meet, pred_f, pred_b = ch_query_csr(
+            self.up_indptr, self.up_indices, self.up_weights,
+            self.down_indptr, self.down_indices, self.down_weights, s, t
+        )
+
+        if meet < 0:
+            raise nx.NetworkXNoPath(f"No path between {source} and {target}.")
+
+        # Walk both search trees out from the meeting node
+        forward = [meet]
+        while pred_f[forward[-1]] >= 0:
+            forward.append(int(pred_f[forward[-1]]))
+        forward.reverse()
+
+        backward = [meet]
+        while pred_b[backward[-1]] >= 0:
+            backward.append(int(pred_b[backward[-1]]))
+
+        path = self._unpack(forward + backward[1:])
+        return best / self.weight_scale, [self.node_ids[i] for i in path]
+
+    def _unpack(self, path):
+        """Expand shortcut edges into the original edges they replace"""
+        unpacked = [path[0]]
+        for u, w in zip(path, path[1:]):
+            stack = [(u, w)]
+            while stack:
+                a, b = stack.pop()
+                mid = self.via.get((a, b))
+                if mid is None:
+                    unpacked.append(b)
+                else:
+                    stack.append((mid, b))
+                    stack.append((a, mid))
+        return unpacked
+
+
+class _Contractor:
+    """Mutable working graph used while building a ContractionHierarchy"""
+
+    def __init__(self, out_adj, in_adj, settle_limit, core_degree):
+        self.out_adj = out_adj
+        self.in_adj = in_adj
+        self.settle_limit = settle_limit
+        self.core_degree = core_degree
+        self.deleted_neighbors = [0] * len(out_adj)
+
+    def _witness_search(self, source, excluded, max_cost, targets):
+        """Bounded Dijkstra from source avoiding excluded; returns tentative distances"""
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        remaining = len(targets)
+        settled = 0
+
+        while heap and remaining and settled < self.settle_limit:
+            cost, v = heapq.heappop(heap)
+            if cost > dist[v]:
+                continue
+            if cost > max_cost:
+                break
+
+            settled += 1
+            if v in targets:
+                remaining -= 1
+
+            for w, c in self.out_adj[v].items():
+                if w == excluded:
+                    continue
+                new_cost = cost + c
+                if new_cost < dist.get(w, INF):
+                    dist[w] = new_cost
+                    heapq.heappush(heap, (new_cost, w))
+
+        return dist
+
+    def _shortcuts(self, v):
+        """Shortcuts (u, w, cost) needed to remove v without changing distances"""
+        ins = self.in_adj[v]
+        outs = self.out_adj[v]
+        shortcuts = []
+
+        if not ins or not outs:
+            return shortcuts
+
+        max_out = max(outs.values())
+        for u, c_uv in ins.items():
+            u_out = self.out_adj[u]
+
+            # A direct edge no longer than the detour is a witness without searching
+            targets = {
+                w for w, c_vw in outs.items()
+                if w != u and u_out.get(w, INF) > c_uv + c_vw
+            }
+            if not targets:
+                continue
+
+            dist = self._witness_search(u, v, c_uv + max_out, targets)
+            for w in targets:
+                cost = c_uv + outs[w]
+                if dist.get(w, INF) > cost:
+                    shortcuts.append((u, w, cost))
+
+        return shortcuts
+
+    def _priority(self, v, shortcuts):
+        """Edge difference plus deleted neighbors, keeping contraction uniform"""
+        return (
+            len(shortcuts)
+            - len(self.in_adj[v]) - len(self.out_adj[v])
+            + self.deleted_neighbors[v]
+        )
+
+    def _degree(self, v):
+        return len(self.in_adj[v]) + len(self.out_adj[v])
+
+    def run(self):
+        n = len(self.out_adj)
+        rank = np.empty(n, dtype=np.int64)
+        up = [None] * n
+        down = [None] * n
+        via = {}
+
+        # Nodes above core_degree (the dense PT walking clusters) are never
+        # contracted: simulating them is slow and would add thousands of
+        # shortcuts each, so they stay behind as an uncontracted core
+        core = [v for v in range(n) if self._degree(v) > self.core_degree]
+        core_set = set(core)
+
+        logger.info(f"Computing initial priorities for {n - len(core):,} nodes ({len(core):,} kept in core)...")
+        heap = [
+            (self._priority(v, self._shortcuts(v)), v)
+            for v in range(n) if v not in core_set
+        ]
+        heapq.heapify(heap)
+
+        order = 0
+        shortcuts_added = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+
+            if self._degree(v) > self.core_degree:
+                core.append(v)
+                continue
+
+            # Lazy update: re-queue v if its priority went stale and it is no longer the minimum
+            shortcuts = self._shortcuts(v)
+            priority = self._priority(v, shortcuts)
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, v))
+                continue
+
+            for u, w, cost in shortcuts:
+                if cost < self.out_adj[u].get(w, INF):
+                    self.out_adj[u][w] = cost
+                    self.in_adj[w][u] = cost
+                    via[(u, w)] = v
+                    shortcuts_added += 1
+
+            # Every remaining neighbor ranks higher than v
+            up[v] = self.out_adj[v]
+            down[v] = self.in_adj[v]
+            for w in up[v]:
+                del self.in_adj[w][v]
+                self.deleted_neighbors[w] += 1
+            for u in down[v]:
+                del self.out_adj[u][v]
+                self.deleted_neighbors[u] += 1
+
+            rank[v] = order
+            order += 1
+            if order % 10000 == 0:
+                logger.info(f"  Contracted {order:,}/{n:,} nodes ({shortcuts_added:,} shortcuts)")
+
+        # Core nodes share the top rank and keep their full core adjacency,
+        # so queries finish with a plain bidirectional Dijkstra inside the core
+        for v in core:
+            up[v] = self.out_adj[v]
+            down[v] = self.in_adj[v]
+            rank[v] = order
+
+        logger.info(f"✅ Contraction complete: {shortcuts_added:,} shortcuts added, {len(core):,} core nodes")
+        return rank, up, down, via
+
+
+def get_contraction_hierarchy(G=None, graph_path=COMBINED_GRAPH_PATH):
+    """
+    Return the ContractionHierarchy for the graph at graph_path.
+
+    The hierarchy is memoized in-process and pickled to COMBINED_CH_PATH; the
+    on-disk copy is reused while it is newer than the graph file. G is only
+    loaded (when not given) if the hierarchy has to be rebuilt.
+    """
+    graph_mtime = os.path.getmtime(graph_path)
+    key = (os.path.abspath(graph_path), graph_mtime)
+
+    if key in _ch_cache:
+        return _ch_cache[key]
+
+    if os.path.exists(COMBINED_CH_PATH) and os.path.getmtime(COMBINED_CH_PATH) > graph_mtime:
+        logger.info(f"Loading contraction hierarchy from {COMBINED_CH_PATH}...")
+        with open(COMBINED_CH_PATH, 'rb', buffering=IO_BUFFER_SIZE) as f:
+            ch = pickle.load(f)
+    else:
+        if G is None:
+            with open(graph_path, 'rb', buffering=IO_BUFFER_SIZE) as f:
+                G = pickle.load(f)
+        ch = build_and_save(G)
+
+    _ch_cache[key] = ch
+    return ch
+
+
+def build_and_save(G):
+    """Contract G on 'time' and pickle the hierarchy to COMBINED_CH_PATH"""
+    logger.info(f"Building contraction hierarchy ({G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges)...")
+    ch = ContractionHierarchy.from_graph(G, weight='time')
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with open(COMBINED_CH_PATH, 'wb', buffering=IO_BUFFER_SIZE) as f:
+        pickle.dump(ch, f, protocol=PICKLE_PROTOCOL)
+    logger.info(f"💾 Saved contraction hierarchy to {COMBINED_CH_PATH}")
+
+    return ch
+
+
+def _query_pair(pair):
+    """Worker: CH query for one (source, target); path is None when unreachable"""
+    source, target = pair
+    try:
+        _, path = get_contraction_hierarchy().query(source, target)
+    except nx.NetworkXNoPath:
+        path = None
+    return source, target, path
+
+
+def query_pairs(pairs, max_workers=None):
+    """
+    Run CH queries for independent (source, target) pairs across processes.
+
+    Returns [(source, target, path or None)] in input order. Workers reuse the
+    hierarchy from get_contraction_hierarchy's cache, so call it once first.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_query_pair, pairs))
+
+
+def main():
+    """Main execution"""
+
+    logger.info("="*60)
+    logger.info("CONTRACTION HIERARCHY PREPROCESSING")
+    logger.info("="*60)
+
+    logger.info(f"Loading combined graph from {COMBINED_GRAPH_PATH}...")
+    with open(COMBINED_GRAPH_PATH, 'rb', buffering=IO_BUFFER_SIZE) as f:
+        G = pickle.load(f)
+
+    ch = build_and_save(G)
+
+    logger.info("\n" + "="*60)
+    logger.info("✅ CONTRACTION HIERARCHY COMPLETE")
+    logger.info("="*60)
+    logger.info(f"Up edges: {len(ch.up_indices):,}")
+    logger.info(f"Down edges: {len(ch.down_indices):,}")
+    logger.info(f"Shortcuts: {len(ch.via):,}")
+
+
+if __name__ == "__main__":
+    main()
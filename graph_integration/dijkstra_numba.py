@@ -0,0 +1,273 @@
+"""
+Numba Dijkstra over CSR Arrays
+Flat-array shortest path kernels with an inlined binary heap, replacing
+NetworkX's pure-Python heapq/dict search in the pathfinding scripts
+"""
+
+import networkx as nx
+import numpy as np
+from numba import njit
+
+from graph_integration.graph_io import MODE_CODES
+
+# Edge weights are stored as uint32 fixed-point integers so the kernels compare
+# integers and weight arrays stay 4 bytes wide. The scale is picked per weight:
+# milliseconds for 'time', millimetres for 'length', and millionths for the
+# much smaller 'emissions' values (the lightest tram/bus edges are ~1e-4)
+WEIGHT_SCALE = {'time': 1000, 'length': 1000, 'emissions': 1_000_000}
+DEFAULT_WEIGHT_SCALE = 1000
+
+UINT32_MAX = np.iinfo(np.uint32).max
+
+# Distance of nodes not reached yet; path sums are accumulated in int64
+UNREACHED = np.iinfo(np.int64).max
+
+
+def weight_scale(weight):
+    """Fixed-point scale used for an edge weight attribute"""
+    return WEIGHT_SCALE.get(weight, DEFAULT_WEIGHT_SCALE)
+
+
+def to_fixed_point(weights, scale):
+    """
+    Round float edge weights to fixed-point integers (int64).
+
+    Raises ValueError if a scaled weight does not fit in uint32.
+    """
+    fixed = np.rint(np.asarray(weights, dtype=np.float64) * scale).astype(np.int64)
+    if len(fixed) and fixed.max() > UINT32_MAX:
+        raise ValueError(
+            f"Edge weight {fixed.max() / scale} overflows uint32 at scale {scale}"
+        )
+    return fixed
+
+
+@njit(cache=True)
+def _heap_push(keys, vals, size, key, val):
+    """Sift (key, val) up into the heap held in keys[:size]/vals[:size]"""
+    i = size
+    while i > 0:
+        parent = (i - 1) >> 1
+        if keys[parent] <= key:
+            break
+        keys[i] = keys[parent]
+        vals[i] = vals[parent]
+        i = parent
+    keys[i] = key
+    vals[i] = val
+    return size + 1
+
+
+@njit(cache=True)
+def _heap_pop(keys, vals, size):
+    """Remove the minimum entry; returns (key, val, new size)"""
+    key = keys[0]
+    val = vals[0]
+    size -= 1
+
+    last_key = keys[size]
+    last_val = vals[size]
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= size:
+            break
+        if child + 1 < size and keys[child + 1] < keys[child]:
+            child += 1
+        if keys[child] >= last_key:
+            break
+        keys[i] = keys[child]
+        vals[i] = vals[child]
+        i = child
+    keys[i] = last_key
+    vals[i] = last_val
+
+    return key, val, size
+
+
+@njit(cache=True)
+def dijkstra_csr(indptr, indices, weights, src, dst):
+    """
+    Point-to-point Dijkstra on a CSR graph, stopping once dst is settled.
+
+    Returns (distance, pred); distance is UNREACHED when dst is unreachable
+    and pred[v] is the node before v on its shortest path (-1 for none).
+    """
+    n = indptr.shape[0] - 1
+    dist = np.full(n, UNREACHED, dtype=np.int64)
+    pred = np.full(n, -1, dtype=np.int32)
+    done = np.zeros(n, dtype=np.bool_)
+
+    # Lazy-deletion heap: at most one entry per relaxed edge plus the source
+    keys = np.empty(indices.shape[0] + 1, dtype=np.int64)
+    vals = np.empty(indices.shape[0] + 1, dtype=np.int32)
+
+    dist[src] = 0
+    size = _heap_push(keys, vals, 0, 0, src)
+
+    while size > 0:
+        cost, v, size = _heap_pop(keys, vals, size)
+        if done[v]:
+            continue
+        done[v] = True
+        if v == dst:
+            break
+
+        for e in range(indptr[v], indptr[v + 1]):
+            w = indices[e]
+            new_cost = cost + weights[e]
+            if new_cost < dist[w]:
+                dist[w] = new_cost
+                pred[w] = v
+                size = _heap_push(keys, vals, size, new_cost, w)
+
+    return dist[dst], pred
+
+
+@njit(cache=True)
+def _ch_step(indptr, indices, weights, dist, pred, other_dist, keys, vals, size, best, meet):
+    """Settle the next node of one direction of a CH query"""
+    cost, v, size = _heap_pop(keys, vals, size)
+    if cost > dist[v]:
+        return size, best, meet
+
+    if other_dist[v] != UNREACHED and cost + other_dist[v] < best:
+        best = cost + other_dist[v]
+        meet = v
+
+    for e in range(indptr[v], indptr[v + 1]):
+        w = indices[e]
+        new_cost = cost + weights[e]
+        if new_cost < dist[w]:
+            dist[w] = new_cost
+            pred[w] = v
+            size = _heap_push(keys, vals, size, new_cost, w)
+
+    return size, best, meet
+
+
+@njit(cache=True)
+def ch_query_csr(up_indptr, up_indices, up_weights,
+                 down_indptr, down_indices, down_weights, s, t):
+    """
+    Bidirectional upward search of a contraction hierarchy.
+
+    Returns (distance, meeting node, forward pred, backward pred); the
+    meeting node is -1 when t is unreachable from s.
+    """
+    n = up_indptr.shape[0] - 1
+    dist_f = np.full(n, UNREACHED, dtype=np.int64)
+    dist_b = np.full(n, UNREACHED, dtype=np.int64)
+    pred_f = np.full(n, -1, dtype=up_indices.dtype)
+    pred_b = np.full(n, -1, dtype=down_indices.dtype)
+
+    keys_f = np.empty(up_indices.shape[0] + 1, dtype=np.int64)
+    vals_f = np.empty(up_indices.shape[0] + 1, dtype=up_indices.dtype)
+    keys_b = np.empty(down_indices.shape[0] + 1, dtype=np.int64)
+    vals_b = np.empty(down_indices.shape[0] + 1, dtype=down_indices.dtype)
+
+    dist_f[s] = 0
+    dist_b[t] = 0
+    size_f = _heap_push(keys_f, vals_f, 0, 0, s)
+    size_b = _heap_push(keys_b, vals_b, 0, 0, t)
+
+    best = UNREACHED
+    meet = -1
+
+    # Alternate directions; each stops once its queue can no longer improve best
+    while True:
+        progressed = False
+
+        if size_f > 0 and keys_f[0] < best:
+            size_f, best, meet = _ch_step(
+                up_indptr, up_indices, up_weights, dist_f, pred_f, dist_b,
+                keys_f, vals_f, size_f, best, meet
+            )
+            progressed = True
+
+        if size_b > 0 and keys_b[0] < best:
+            size_b, best, meet = _ch_step(
+                down_indptr, down_indices, down_weights, dist_b, pred_b, dist_f,
+                keys_b, vals_b, size_b, best, meet
+            )
+            progressed = True
+
+        if not progressed:
+            break
+
+    return best, meet, pred_f, pred_b
+
+
+class CSRGraph:
+    """CSR arrays for one edge weight of a graph, with string <-> int node IDs"""
+
+    def __init__(self, node_ids, indptr, indices, weights, modes, weight_scale):
+        self.node_ids = node_ids
+        self.id_of = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.modes = modes
+        self.weight_scale = weight_scale
+
+    @classmethod
+    def from_graph(cls, G, weight='time'):
+        """
+        Convert G once into int32 CSR arrays with uint32 fixed-point weights.
+
+        Edges missing the weight attribute count as 1, matching NetworkX;
+        edges of an undirected G become arcs in both directions.
+        """
+        node_ids = list(G.nodes())
+        id_of = {node_id: i for i, node_id in enumerate(node_ids)}
+
+        n_edges = G.number_of_edges()
+        src = np.empty(n_edges, dtype=np.int32)
+        indices = np.empty(n_edges, dtype=np.int32)
+        weights = np.empty(n_edges, dtype=np.float64)
+        modes = np.empty(n_edges, dtype=np.int8)
+
+        for i, (u, v, data) in enumerate(G.edges(data=True)):
+            src[i] = id_of[u]
+            indices[i] = id_of[v]
+            weights[i] = data.get(weight, 1)
+            modes[i] = MODE_CODES.get(data.get('mode'), -1)
+
+        # Undirected graphs list each edge once; add the reverse arcs
+        if not G.is_directed():
+            src, indices = np.concatenate([src, indices]), np.concatenate([indices, src])
+            weights = np.concatenate([weights, weights])
+            modes = np.concatenate([modes, modes])
+
+        order = np.argsort(src, kind='stable')
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int32)
+        indptr[1:] = np.cumsum(np.bincount(src, minlength=len(node_ids)))
+
+        scale = weight_scale(weight)
+        weights = to_fixed_point(weights[order], scale).astype(np.uint32)
+
+        return cls(node_ids, indptr, indices[order], weights, modes[order], scale)
+
+    def shortest_path(self, source, target):
+        """
+        Shortest (length, path) from source to target.
+
+        Raises nx.NodeNotFound / nx.NetworkXNoPath like nx.shortest_path.
+        """
+        for node in (source, target):
+            if node not in self.id_of:
+                raise nx.NodeNotFound(f"Node {node} not in graph")
+
+        s = self.id_of[source]
+        t = self.id_of[target]
+        length, pred = dijkstra_csr(self.indptr, self.indices, self.weights, s, t)
+
+        if length == UNREACHED:
+            raise nx.NetworkXNoPath(f"No path between {source} and {target}.")
+
+        path = [t]
+        while path[-1] != s:
+            path.append(pred[path[-1]])
+        path.reverse()
+
+        return length / self.weight_scale, [self.node_ids[i] for i in path]
@@ -0,0 +1,25 @@
+"""
+Process-wide Graph Cache
+Loads the combined graph's binary arrays once per process, memory-mapped so
+repeat loads are free and concurrent processes share the same pages
+"""
+
+import functools
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_integration import COMBINED_GRAPH_BIN_PATH
+from graph_integration.graph_io import load_graph_bin
+
+
+@functools.lru_cache(maxsize=1)
+def get_graph():
+    """Return the combined graph's GraphArrays, memory-mapped read-only"""
+    try:
+        return load_graph_bin(COMBINED_GRAPH_BIN_PATH, mmap_mode='r')
+    except FileNotFoundError as e:
+        raise FileNotFoundError(
+            f"Combined graph arrays not found at {COMBINED_GRAPH_BIN_PATH} ({e.filename}); "
+            "run graph_integration/merge_graphs.py first"
+        ) from e
@@ -0,0 +1,159 @@
+"""
+Binary Graph Format
+Stores a graph as flat NumPy arrays (CSR edges, per-edge attributes, node
+coordinates), one .npy per array in a directory, so scripts that only need
+counts, modes or coordinates skip unpickling millions of attribute dicts and
+can memory-map the arrays
+"""
+
+import numpy as np
+import logging
+import os
+from collections import namedtuple
+from scipy.sparse import csr_matrix
+
+logger = logging.getLogger(__name__)
+
+# int8 codes for the node/edge 'mode', node 'node_type' and edge 'edge_type'
+# attributes; missing or unknown values are stored as -1
+MODE_CODES = {'walk': 0, 'car': 1, 'bus': 2, 'tram': 3, 'train': 4, 'pt': 5}
+NODE_TYPE_CODES = {'road_intersection': 0, 'pt_stop': 1}
+EDGE_TYPE_CODES = {'pt_transfer': 0, 'road': 1, 'car_to_pt_transfer': 2}
+
+MODE_NAMES = {code: name for name, code in MODE_CODES.items()}
+NODE_TYPE_NAMES = {code: name for name, code in NODE_TYPE_CODES.items()}
+EDGE_TYPE_NAMES = {code: name for name, code in EDGE_TYPE_CODES.items()}
+
+GraphArrays = namedtuple('GraphArrays', [
+    'node_ids',         # str[n], node i's original ID
+    'coords',           # float32[n, 2], (lat, lon); NaN where missing
+    'node_modes',       # int8[n]
+    'node_types',       # int8[n], 0 = road intersection, 1 = PT stop
+    'indptr',           # int32[n + 1], CSR row offsets by source node
+    'indices',          # int32[nnz], edge target nodes
+    'time',             # float32[nnz], NaN where missing
+    'distance',         # float32[nnz], NaN where missing
+    'emissions',        # float32[nnz], NaN where missing
+    'modes',            # int8[nnz]
+    'edge_types'        # int8[nnz]
+])
+
+
+def save_graph_bin(G, path):
+    """Write G's structure and core attributes as .npy files in directory path"""
+    node_ids = list(G.nodes())
+    id_of = {node_id: i for i, node_id in enumerate(node_ids)}
+    n = len(node_ids)
+
+    coords = np.full((n, 2), np.nan, dtype=np.float32)
+    node_modes = np.full(n, -1, dtype=np.int8)
+    node_types = np.full(n, -1, dtype=np.int8)
+    for i, (_, data) in enumerate(G.nodes(data=True)):
+        if data.get('lat') is not None and data.get('lon') is not None:
+            coords[i] = data['lat'], data['lon']
+        node_modes[i] = MODE_CODES.get(data.get('mode'), -1)
+        node_types[i] = NODE_TYPE_CODES.get(data.get('node_type'), -1)
+
+    n_edges = G.number_of_edges()
+    src = np.empty(n_edges, dtype=np.int32)
+    indices = np.empty(n_edges, dtype=np.int32)
+    weights = {attr: np.full(n_edges, np.nan, dtype=np.float32) for attr in ('time', 'distance', 'emissions')}
+    modes = np.empty(n_edges, dtype=np.int8)
+    edge_types = np.empty(n_edges, dtype=np.int8)
+
+    for i, (u, v, data) in enumerate(G.edges(data=True)):
+        src[i] = id_of[u]
+        indices[i] = id_of[v]
+        for attr, values in weights.items():
+            if data.get(attr) is not None:
+                values[i] = data[attr]
+        modes[i] = MODE_CODES.get(data.get('mode'), -1)
+        edge_types[i] = EDGE_TYPE_CODES.get(data.get('edge_type'), -1)
+
+    # Group edges by source node for the CSR layout
+    order = np.argsort(src, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum(np.bincount(src, minlength=n))
+
+    arrays = GraphArrays(
+        node_ids=np.array(node_ids, dtype=str),
+        coords=coords,
+        node_modes=node_modes,
+        node_types=node_types,
+        indptr=indptr,
+        indices=indices[order],
+        time=weights['time'][order],
+        distance=weights['distance'][order],
+        emissions=weights['emissions'][order],
+        modes=modes[order],
+        edge_types=edge_types[order]
+    )
+
+    os.makedirs(path, exist_ok=True)
+    for field, values in zip(GraphArrays._fields, arrays):
+        np.save(os.path.join(path, f'{field}.npy'), values)
+
+
+def node_coord_arrays(G):
+    """
+    Index G's nodes and pull their coordinates into arrays.
+
+    Returns (node_index, lats, lons): node_index maps node ID to its position
+    in G.nodes, and lats/lons are float64 arrays with NaN where missing.
+    """
+    node_index = {node_id: i for i, node_id in enumerate(G.nodes())}
+    lats = np.fromiter(
+        (data.get('lat', np.nan) for _, data in G.nodes(data=True)), dtype=np.float64, count=len(node_index)
+    )
+    lons = np.fromiter(
+        (data.get('lon', np.nan) for _, data in G.nodes(data=True)), dtype=np.float64, count=len(node_index)
+    )
+    return node_index, lats, lons
+
+
+def count_codes(codes, names, missing='unknown'):
+    """Tally int8 attribute codes into {name: count} with a single bincount"""
+    counts = np.bincount(codes.astype(np.int64) + 1, minlength=len(names) + 1)
+
+    tally = {}
+    if counts[0]:
+        tally[missing] = int(counts[0])
+    for code, name in names.items():
+        if counts[code + 1]:
+            tally[name] = int(counts[code + 1])
+    return tally
+
+
+def adjacency_matrix(graph, data=None):
+    """
+    Wrap a GraphArrays' CSR edges as a scipy.sparse matrix without copying.
+
+    data holds one value per edge (e.g. graph.time); edges default to 1.
+    """
+    n = len(graph.node_ids)
+    if data is None:
+        data = np.ones(len(graph.indices), dtype=np.int8)
+    return csr_matrix((data, graph.indices, graph.indptr), shape=(n, n))
+
+
+def path_edges(graph, id_of, path):
+    """CSR positions of the edges along a path of node IDs"""
+    edges = np.empty(max(len(path) - 1, 0), dtype=np.int64)
+    for k, (u, v) in enumerate(zip(path, path[1:])):
+        start = graph.indptr[id_of[u]]
+        neighbors = graph.indices[start:graph.indptr[id_of[u] + 1]]
+        edges[k] = start + np.flatnonzero(neighbors == id_of[v])[0]
+    return edges
+
+
+def load_graph_bin(path, mmap_mode=None):
+    """
+    Load a graph written by save_graph_bin as a GraphArrays namedtuple.
+
+    With mmap_mode='r' the arrays are read-only memory maps: pages load on
+    first touch and are shared by every process mapping the same files.
+    """
+    return GraphArrays(*(
+        np.load(os.path.join(path, f'{field}.npy'), mmap_mode=mmap_mode)
+        for field in GraphArrays._fields
+    ))
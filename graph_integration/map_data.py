@@ -0,0 +1,122 @@
+"""
+Map Data for the Visualizations
+Node coordinates, an edge index table and the train stations of the combined
+graph as flat arrays, cached in an .npz so map runs skip unpickling the graph
+"""
+
+import numpy as np
+import pickle
+import logging
+import os
+import sys
+from collections import namedtuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_integration import COMBINED_GRAPH_PATH, COMBINED_MAP_CACHE, OUTPUT_DIR, IO_BUFFER_SIZE
+from graph_integration.graph_io import node_coord_arrays
+from stops.identify_train_stations import is_train_edge
+
+logger = logging.getLogger(__name__)
+
+MapData = namedtuple('MapData', [
+    'node_ids',           # str[n]
+    'lats',               # float64[n], NaN where missing
+    'lons',               # float64[n], NaN where missing
+    'train_mask',         # bool[n], endpoints of train edges
+    'station_names',      # str[n_train], marker label of each train station in node order
+    'u_idx',              # int64[e], edge source node
+    'v_idx',              # int64[e], edge target node
+    'mode_idx',           # int8[e], index into mode_names
+    'mode_names',         # str[k], display modes; car->PT transfers are 'connection'
+    'distance',           # float32[e], 0 where missing
+    'time',               # float32[e], 0 where missing
+    'connection_idx',     # int64[c], edge positions of the connection edges
+    'connection_names'    # str[c], station each connection edge leads to
+])
+
+
+def build_map_data(G):
+    """Extract everything the map scripts draw from G in one pass over the edges"""
+    node_index, lats, lons = node_coord_arrays(G)
+
+    n_edges = G.number_of_edges()
+    u_idx = np.empty(n_edges, dtype=np.int64)
+    v_idx = np.empty(n_edges, dtype=np.int64)
+    mode_idx = np.empty(n_edges, dtype=np.int8)
+    distance = np.empty(n_edges, dtype=np.float32)
+    time = np.empty(n_edges, dtype=np.float32)
+    is_train = np.empty(n_edges, dtype=bool)
+    mode_codes = {}
+    connection_idx = []
+    connection_names = []
+
+    for i, (u, v, data) in enumerate(G.edges(data=True)):
+        mode = data.get('mode', 'unknown')
+
+        # Train edges are flagged in this pass instead of a second traversal of the edges
+        is_train[i] = is_train_edge(data)
+
+        # Special handling for car-to-PT connections
+        if data.get('edge_type', '') == 'car_to_pt_transfer':
+            mode = 'connection'
+            connection_idx.append(i)
+            connection_names.append(data.get('station_name', 'Unknown'))
+
+        u_idx[i] = node_index[u]
+        v_idx[i] = node_index[v]
+        mode_idx[i] = mode_codes.setdefault(mode, len(mode_codes))
+        distance[i] = data.get('distance', 0)
+        time[i] = data.get('time', 0)
+
+    # Train stations are the endpoints of the train edges
+    train_mask = np.zeros(len(node_index), dtype=bool)
+    train_mask[u_idx[is_train]] = True
+    train_mask[v_idx[is_train]] = True
+    node_ids = list(node_index)
+    station_names = [
+        G.nodes[node_ids[i]].get('station_name', str(node_ids[i]))
+        for i in np.flatnonzero(train_mask).tolist()
+    ]
+
+    return MapData(
+        node_ids=np.array(node_ids, dtype=str),
+        lats=lats,
+        lons=lons,
+        train_mask=train_mask,
+        station_names=np.array(station_names, dtype=str),
+        u_idx=u_idx,
+        v_idx=v_idx,
+        mode_idx=mode_idx,
+        mode_names=np.array(list(mode_codes), dtype=str),
+        distance=distance,
+        time=time,
+        connection_idx=np.array(connection_idx, dtype=np.int64),
+        connection_names=np.array(connection_names, dtype=str)
+    )
+
+
+def load_map_data(graph_path=COMBINED_GRAPH_PATH):
+    """
+    Return the MapData for the graph at graph_path.
+
+    The arrays are cached in COMBINED_MAP_CACHE; the cache is reused while it
+    is newer than the graph file, otherwise the graph is loaded and re-extracted.
+    """
+    if os.path.exists(COMBINED_MAP_CACHE) and os.path.getmtime(COMBINED_MAP_CACHE) > os.path.getmtime(graph_path):
+        logger.info(f"Loading cached map data from {COMBINED_MAP_CACHE}...")
+        with np.load(COMBINED_MAP_CACHE) as cached:
+            data = MapData(*(cached[field] for field in MapData._fields))
+    else:
+        logger.info(f"Loading combined graph from {graph_path}...")
+        with open(graph_path, 'rb', buffering=IO_BUFFER_SIZE) as f:
+            G = pickle.load(f)
+        logger.info(f"✅ Loaded: {G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges")
+
+        data = build_map_data(G)
+
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        np.savez_compressed(COMBINED_MAP_CACHE, **data._asdict())
+        logger.info(f"💾 Cached map data to {COMBINED_MAP_CACHE}")
+
+    logger.info(f"✅ Map data: {len(data.node_ids):,} nodes, {len(data.u_idx):,} edges")
+    return data
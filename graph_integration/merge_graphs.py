@@ -5,12 +5,16 @@ import json
 import logging
 import os
 import sys
+from collections import Counter
+from itertools import chain, islice
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config_integration import (
-    PT_GRAPH_PATH, CAR_GRAPH_PATH, COMBINED_GRAPH_PATH,
-    OUTPUT_DIR, WALKING_SPEED, LOG_LEVEL, LOG_FORMAT
+    PT_GRAPH_PATH, CAR_GRAPH_PATH, COMBINED_GRAPH_PATH, COMBINED_GRAPH_BIN_PATH,
+    OUTPUT_DIR, WALKING_SPEED, LOG_LEVEL, LOG_FORMAT,
+    IO_BUFFER_SIZE, PICKLE_PROTOCOL
 )
+from graph_integration.graph_io import save_graph_bin
 
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
@@ -24,13 +28,13 @@ def load_graphs():
     
     # Load PT graph (with walking connections)
     logger.info(f"  PT graph from {PT_GRAPH_PATH}...")
-    with open(PT_GRAPH_PATH, 'rb') as f:
+    with open(PT_GRAPH_PATH, 'rb', buffering=IO_BUFFER_SIZE) as f:
         G_pt = pickle.load(f)
     logger.info(f"  ✅ PT: {G_pt.number_of_nodes():,} nodes, {G_pt.number_of_edges():,} edges")
     
     # Load Car graph
     logger.info(f"  Car graph from {CAR_GRAPH_PATH}...")
-    with open(CAR_GRAPH_PATH, 'rb') as f:
+    with open(CAR_GRAPH_PATH, 'rb', buffering=IO_BUFFER_SIZE) as f:
         G_car = pickle.load(f)
     logger.info(f"  ✅ Car: {G_car.number_of_nodes():,} nodes, {G_car.number_of_edges():,} edges")
     
@@ -49,12 +53,20 @@ def load_connections():
 
 
 def create_combined_graph(G_pt, G_car, connections):
-    """Merge graphs and add connection edges"""
+    """
+    Merge graphs and add connection edges.
+
+    Returns (G_combined, is_road), where is_road maps every node to whether it's a road node.
+    """
     
     logger.info("\n" + "="*60)
     logger.info("CREATING COMBINED GRAPH")
     logger.info("="*60)
     
+    # Tag each node once instead of prefix-matching both ends of every edge;
+    # shared by the checks below, the analysis and the routing test
+    is_road = {n: str(n).startswith('road_') for n in chain(G_pt.nodes(), G_car.nodes())}
+    
     # Create new directed graph
     G_combined = nx.DiGraph()
     
@@ -65,27 +77,32 @@ def create_combined_graph(G_pt, G_car, connections):
     logger.info(f"  ✅ Added {G_pt.number_of_nodes():,} PT nodes")
     logger.info(f"  ✅ Added {G_pt.number_of_edges():,} PT edges")
 
+    # Existing edges, so reverse-edge checks are set lookups instead of has_edge calls
+    edge_set = set(G_combined.edges())
+
     # FIX: Ensure bidirectionality for walking edges
     logger.info("\n🔄 Ensuring bidirectionality for walking edges...")
-    walking_edges_added = 0
-    for u, v, data in G_pt.edges(data=True):
-        if (data.get('mode') == 'walk' and 
-            data.get('edge_type') == 'pt_transfer' and
-            not G_combined.has_edge(v, u)):  # If reverse edge doesn't exist
-            # Add the reverse edge
-            G_combined.add_edge(v, u, **data)
-            walking_edges_added += 1
+    reverse_walking = [
+        (v, u, data) for u, v, data in G_pt.edges(data=True)
+        if data.get('mode') == 'walk' and
+        data.get('edge_type') == 'pt_transfer' and
+        (v, u) not in edge_set  # If reverse edge doesn't exist
+    ]
+    G_combined.add_edges_from(reverse_walking)
+    edge_set.update((u, v) for u, v, _ in reverse_walking)
+    walking_edges_added = len(reverse_walking)
 
     print("Adding reverse edges for transport modes...")
-    reverse_edges_added = 0
 
-    for u, v, data in G_combined.edges(data=True):
-        if data.get('mode') in ['tram', 'bus', 'train']:
-            # If reverse edge doesn't exist, add it
-            if not G_combined.has_edge(v, u):
-                # Create reverse edge with same attributes
-                G_combined.add_edge(v, u, **data)
-                reverse_edges_added += 1
+    # Create reverse edges with the same attributes where they don't exist
+    reverse_transport = [
+        (v, u, data) for u, v, data in G_combined.edges(data=True)
+        if data.get('mode') in ['tram', 'bus', 'train'] and
+        (v, u) not in edge_set
+    ]
+    G_combined.add_edges_from(reverse_transport)
+    edge_set.update((u, v) for u, v, _ in reverse_transport)
+    reverse_edges_added = len(reverse_transport)
 
     print(f"✅ Added {reverse_edges_added} reverse transport edges")
 
@@ -99,10 +116,10 @@ def create_combined_graph(G_pt, G_car, connections):
     for u, v, data in G_combined.edges(data=True):
         if (data.get('mode') == 'walk' and 
             data.get('edge_type') == 'pt_transfer' and
-            not u.startswith('road_') and 
-            not v.startswith('road_')):
+            not is_road[u] and 
+            not is_road[v]):
             pt_walking_in_combined += 1
-            if G_combined.has_edge(v, u):
+            if (v, u) in edge_set:
                 bidirectional_in_combined += 1
     
     logger.info(f"  PT walking edges in combined: {pt_walking_in_combined}")
@@ -119,34 +136,32 @@ def create_combined_graph(G_pt, G_car, connections):
     # Add ONE-WAY connection edges (car → PT only)
     logger.info("\nAdding car-to-PT connection edges (ONE-WAY)...")
     
-    connections_added = 0
-    for conn in connections:
-        road_node = conn['road_node']
-        station_id = conn['station_id']
-        distance = conn['distance']
-        walk_time = conn['walk_time']
-        
-        # Add ONE-WAY edge: road → station
-        G_combined.add_edge(
-            road_node,
-            station_id,
-            mode='walk',
-            distance=distance,
-            time=walk_time,
-            emissions=0,
-            edge_type='car_to_pt_transfer',
-            station_name=conn['station_name']
+    # ONE-WAY edges: road → station
+    connection_edges = [
+        (
+            conn['road_node'],
+            conn['station_id'],
+            {
+                'mode': 'walk',
+                'distance': conn['distance'],
+                'time': conn['walk_time'],
+                'emissions': 0,
+                'edge_type': 'car_to_pt_transfer',
+                'station_name': conn['station_name']
+            }
         )
-        
-        connections_added += 1
+        for conn in connections
+    ]
+    G_combined.add_edges_from(connection_edges)
+    connections_added = len(connection_edges)
     
     logger.info(f"  ✅ Added {connections_added} one-way connection edges (car→PT)")
     
-    return G_combined
+    return G_combined, is_road
 
 
-def analyze_combined_graph(G):
-    """Analyze the combined graph"""
+def analyze_combined_graph(G, is_road):
+    """Analyze the combined graph; is_road maps each node to whether it's a road node"""
     
     logger.info("\n" + "="*60)
     logger.info("COMBINED GRAPH ANALYSIS")
@@ -155,14 +170,12 @@ def analyze_combined_graph(G):
     logger.info(f"\nTotal nodes: {G.number_of_nodes():,}")
     logger.info(f"Total edges: {G.number_of_edges():,}")
     
-    # Count by mode
-    mode_counts = {}
-    for u, v, data in G.edges(data=True):
-        mode = data.get('mode', 'unknown')
-        mode_counts[mode] = mode_counts.get(mode, 0) + 1
+    # Count by mode in one pass over the stored edge dicts (data=True skips
+    # the per-edge attribute lookup networkx does for data='mode')
+    mode_counts = Counter(data.get('mode', 'unknown') for _, _, data in G.edges(data=True))
     
     logger.info("\nEdges by mode:")
-    for mode, count in sorted(mode_counts.items(), key=lambda x: x[1], reverse=True):
+    for mode, count in mode_counts.most_common():
         logger.info(f"  {mode:10s}: {count:,}")
     
     # Check connectivity
@@ -175,11 +188,11 @@ def analyze_combined_graph(G):
         else:
             logger.warning(f"⚠️  Graph has {weak_components} separate components")
 
-    pt_nodes = [n for n in G.nodes if not str(n).startswith('road_')]
+    pt_nodes = [n for n, road in is_road.items() if not road]
     logger.info(f"PT nodes detected: {len(pt_nodes)}")
 
 
-def test_multimodal_path(G):
+def test_multimodal_path(G, is_road):
     """Test that multimodal routing works"""
     
     logger.info("\n" + "="*60)
@@ -187,8 +200,8 @@ def test_multimodal_path(G):
     logger.info("="*60)
     
     # Find a car node and a PT node
-    car_nodes = [n for n in G.nodes() if str(n).startswith('road_')]
-    pt_nodes = [n for n in G.nodes() if not str(n).startswith('road_')]
+    car_nodes = [n for n, road in is_road.items() if road]
+    pt_nodes = [n for n, road in is_road.items() if not road]
     
     if not car_nodes or not pt_nodes:
         logger.warning("Cannot test - missing nodes")
@@ -202,14 +215,16 @@ def test_multimodal_path(G):
     logger.info(f"  Target: {target}")
     
     try:
-        path = nx.shortest_path(G, source, target, weight='time')
+        # Point-to-point check: search from both ends and stop where they meet
+        _, path = nx.bidirectional_dijkstra(G, source, target, weight='time')
         logger.info(f"\n✅ Multimodal path found!")
         logger.info(f"   Path length: {len(path)} nodes")
         
         # Analyze path
+        hops = list(zip(path, path[1:]))
         modes_used = []
-        for i in range(len(path)-1):
-            mode = G[path[i]][path[i+1]].get('mode', 'unknown')
+        for u, v in hops:
+            mode = G[u][v].get('mode', 'unknown')
             if not modes_used or modes_used[-1] != mode:
                 modes_used.append(mode)
         
@@ -217,8 +232,7 @@ def test_multimodal_path(G):
         
         # Show first few hops
         logger.info("\n   Path preview:")
-        for i in range(min(5, len(path)-1)):
-            u, v = path[i], path[i+1]
+        for u, v in islice(hops, 5):
             mode = G[u][v].get('mode')
             logger.info(f"      {u} --[{mode}]--> {v}")
         
@@ -238,8 +252,12 @@ def save_combined_graph(G):
     
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
-    with open(COMBINED_GRAPH_PATH, 'wb') as f:
-        pickle.dump(G, f)
+    with open(COMBINED_GRAPH_PATH, 'wb', buffering=IO_BUFFER_SIZE) as f:
+        pickle.dump(G, f, protocol=PICKLE_PROTOCOL)
+    
+    # Flat array copy for scripts that don't need the full NetworkX graph
+    logger.info(f"💾 Saving binary graph arrays to {COMBINED_GRAPH_BIN_PATH}...")
+    save_graph_bin(G, COMBINED_GRAPH_BIN_PATH)
     
     logger.info("✅ Saved")
 
@@ -258,13 +276,13 @@ def main():
     connections = load_connections()
     
     # Create combined graph
-    G_combined = create_combined_graph(G_pt, G_car, connections)
+    G_combined, is_road = create_combined_graph(G_pt, G_car, connections)
     
     # Analyze
-    analyze_combined_graph(G_combined)
+    analyze_combined_graph(G_combined, is_road)
     
     # Test routing
-    test_multimodal_path(G_combined)
+    test_multimodal_path(G_combined, is_road)
     
     # Save
     save_combined_graph(G_combined)
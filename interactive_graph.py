@@ -3,45 +3,118 @@ Step 5: Visualize Combined Multimodal Graph
 Creates interactive HTML map with Folium
 """
 import folium
-import networkx as nx
-import pickle
+from folium.elements import MacroElement
+from folium.plugins import FastMarkerCluster
+from folium.template import Template
+import numpy as np
+import orjson
 import logging
 import os
 import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from shapely.geometry import LineString
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config_integration import (
-    COMBINED_GRAPH_PATH, COMBINED_VISUALIZATION,
-    MODE_COLORS, LOG_LEVEL, LOG_FORMAT
+    COMBINED_VISUALIZATION, MODE_COLORS, SIMPLIFY_TOLERANCE_M, MAP_BOUNDS,
+    MAP_DETAIL_ZOOM, MAP_OVERVIEW_GRID_M, MAP_HIDDEN_MODES,
+    LOG_LEVEL, LOG_FORMAT
 )
+from graph_integration.map_data import load_map_data
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
+# Rough meters per degree, to express simplification tolerances in lat/lon
+METERS_PER_DEGREE = 111320
+
+# Modes that get clickable popups; car and walk are the bulk of the edges and get none
+POPUP_MODES = {'train', 'tram', 'bus', 'connection'}
+
+# Popup of a car-to-train connection edge, filled in per edge with str.format
+CONNECTION_POPUP_TMPL = """
+<b>🚗→🚉 Car to Train Transfer</b><br>
+<b>Station:</b> {station}<br>
+<b>Walking:</b> {distance:.1f}m ({minutes:.1f} min)
+"""
+
+# Builds each station marker in the browser from a [lat, lon, name, node_id] row
+STATION_MARKER_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: 'train', prefix: 'fa', markerColor: 'blue'});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindPopup('<b>🚉 ' + row[2] + '</b><br>ID: ' + row[3]);
+    marker.bindTooltip(row[2]);
+    return marker;
+}
+"""
 
-def load_combined_graph():
-    """Load the combined graph"""
-    logger.info(f"Loading combined graph from {COMBINED_GRAPH_PATH}...")
-    
-    with open(COMBINED_GRAPH_PATH, 'rb') as f:
-        G = pickle.load(f)
-    
-    logger.info(f"✅ Loaded: {G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges")
-    return G
 
+class DetailOnZoom(MacroElement):
+    """
+    Fetch GeoJson layer files asynchronously, swapping each layer between its
+    overview and detail file around a zoom level.
 
-def create_map(G):
+    Layers are only fetched while shown, so unticked ones cost nothing until
+    they are switched on in the layer control.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            var levels = [
+            {%- for layer, overview, detail in this.layers %}
+                {layer: {{ layer.get_name() }}, overview: {{ overview|tojson }}, detail: {{ detail|tojson }}, url: null},
+            {%- endfor %}
+            ];
+            // Parsed files by URL, so zooming back and forth fetches each file once
+            var cache = {};
+            function update() {
+                var next = map.getZoom() >= {{ this.detail_zoom }} ? 'detail' : 'overview';
+                levels.forEach(function (entry) {
+                    var url = entry[next];
+                    if (entry.url === url || !map.hasLayer(entry.layer)) {
+                        return;
+                    }
+                    entry.url = url;
+                    function show(data) {
+                        cache[url] = data;
+                        if (entry.url === url) {
+                            entry.layer.clearLayers();
+                            entry.layer.addData(data);
+                        }
+                    }
+                    if (cache[url]) {
+                        show(cache[url]);
+                    } else {
+                        $.getJSON(url, show);
+                    }
+                });
+            }
+            map.on('zoomend overlayadd', update);
+            update();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, layers, detail_zoom):
+        super().__init__()
+        self._name = 'DetailOnZoom'
+        self.layers = layers
+        self.detail_zoom = detail_zoom
+
+
+def create_map(lats, lons):
     """Create interactive Folium map"""
     
     logger.info("\nCreating interactive map...")
     
     # Calculate center point
-    lats = [d['lat'] for n, d in G.nodes(data=True) if 'lat' in d]
-    lons = [d['lon'] for n, d in G.nodes(data=True) if 'lon' in d]
-    
-    avg_lat = sum(lats) / len(lats)
-    avg_lon = sum(lons) / len(lons)
+    avg_lat = np.nanmean(lats)
+    avg_lon = np.nanmean(lons)
     
     logger.info(f"Map center: ({avg_lat:.6f}, {avg_lon:.6f})")
     
@@ -55,51 +128,193 @@ def create_map(G):
     return m
 
 
-def add_edges_to_map(m, G):
+def bounds_mask(lats, lons):
+    """Per-node mask of nodes inside MAP_BOUNDS (all True when unset)"""
+    if MAP_BOUNDS is None:
+        return np.ones(len(lats), dtype=bool)
+    min_lat, min_lon, max_lat, max_lon = MAP_BOUNDS
+    return (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+
+
+def chain_edges(u_idx, v_idx):
+    """
+    Merge edges into polylines of node indices, ignoring direction.
+
+    Chains run through nodes with exactly two neighbours and break everywhere
+    else, so a two-way street is drawn once and a curved road is one line.
+    """
+    adjacency = defaultdict(set)
+    for u, v in zip(u_idx.tolist(), v_idx.tolist()):
+        if u != v:
+            adjacency[u].add(v)
+            adjacency[v].add(u)
+    degree = {node: len(nbrs) for node, nbrs in adjacency.items()}
+    
+    # Edges are removed from adjacency as they are walked, instead of being
+    # tracked in a set of visited (u, v) pairs the size of the edge list
+    def take(u):
+        v = adjacency[u].pop()
+        adjacency[v].discard(u)
+        return v
+    
+    def walk(start):
+        chain = [start, take(start)]
+        while degree[chain[-1]] == 2 and adjacency[chain[-1]]:
+            chain.append(take(chain[-1]))
+        return chain
+    
+    # Start from chain ends first; whatever is left over forms closed loops
+    chains = []
+    starts = [n for n in adjacency if degree[n] != 2] + list(adjacency)
+    for start in starts:
+        while adjacency[start]:
+            chains.append(walk(start))
+    
+    return chains
+
+
+def simplify_chain(coords, tolerance_m):
+    """Douglas-Peucker simplify a list of (lon, lat) points"""
+    if len(coords) <= 2:
+        return coords
+    line = LineString(coords).simplify(tolerance_m / METERS_PER_DEGREE, preserve_topology=False)
+    return list(line.coords)
+
+
+def edges_geojson_path(mode):
+    """GeoJSON file holding one mode's edges, next to the map HTML"""
+    return f"{os.path.splitext(COMBINED_VISUALIZATION)[0]}_{mode}.geojson"
+
+
+def edges_feature_collection(segments, properties):
+    """(lon, lat) polylines as a one-feature MultiLineString FeatureCollection"""
+    feature = {
+        'type': 'Feature',
+        'id': properties['mode'],
+        'geometry': {
+            'type': 'MultiLineString',
+            'coordinates': segments
+        },
+        'properties': properties
+    }
+    return {'type': 'FeatureCollection', 'features': [feature]}
+
+
+def write_edges_geojson(path, segments, properties):
+    """Write (lon, lat) polylines to path as an edges FeatureCollection"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(orjson.dumps(edges_feature_collection(segments, properties)))
+
+
+def snap_segments(segments, grid_m):
+    """
+    Snap polylines to a grid_m grid for the zoomed-out overview.
+
+    Points merging into one cell collapse, polylines shorter than a cell are
+    dropped, and polylines landing on the same cells (either way round) are kept once.
+    """
+    step = grid_m / METERS_PER_DEGREE
+    seen = set()
+    snapped = []
+    for segment in segments:
+        cells = []
+        for lon, lat in segment:
+            cell = (round(lon / step), round(lat / step))
+            if not cells or cells[-1] != cell:
+                cells.append(cell)
+        key = tuple(cells)
+        if len(cells) < 2 or key in seen or key[::-1] in seen:
+            continue
+        seen.add(key)
+        snapped.append([(round(x * step, 6), round(y * step, 6)) for x, y in cells])
+    return snapped
+
+
+def build_layer_files(mode, u_idx, v_idx, node_lonlat, properties, detail_path, overview_path=None):
+    """
+    Worker: chain, simplify and write one mode's edges as GeoJSON.
+
+    Also writes the grid-snapped overview when overview_path is given.
+    Returns (polylines, points, overview polylines or None).
+    """
+    tolerance_m = SIMPLIFY_TOLERANCE_M.get(mode, 5.0)
+    segments = [
+        simplify_chain([node_lonlat[n] for n in chain], tolerance_m)
+        for chain in chain_edges(u_idx, v_idx)
+    ]
+    write_edges_geojson(detail_path, segments, properties)
+    
+    n_overview = None
+    if overview_path is not None:
+        overview = snap_segments(segments, MAP_OVERVIEW_GRID_M[mode])
+        write_edges_geojson(overview_path, overview, properties)
+        n_overview = len(overview)
+    
+    return len(segments), sum(len(segment) for segment in segments), n_overview
+
+
+def add_edges_to_map(m, data):
     """Add all edges to the map by mode"""
     
     logger.info("\nAdding edges to map...")
     
-    # Count edges by mode
-    mode_counts = {}
+    lats, lons = data.lats, data.lons
+    u_idx, v_idx, mode_idx = data.u_idx, data.v_idx, data.mode_idx
+    mode_codes = {name: code for code, name in enumerate(data.mode_names.tolist())}
+    connection_names = dict(zip(data.connection_idx.tolist(), data.connection_names.tolist()))
     
-    # Group edges by mode for efficient drawing
-    edges_by_mode = {}
+    # Skip edges with an endpoint missing coordinates, and cull edges
+    # entirely outside the area of interest
+    has_coords = ~np.isnan(lats) & ~np.isnan(lons)
+    inside = bounds_mask(lats, lons)
+    keep = has_coords[u_idx] & has_coords[v_idx] & (inside[u_idx] | inside[v_idx])
     
-    for u, v, data in G.edges(data=True):
-        from_node = G.nodes[u]
-        to_node = G.nodes[v]
-        
-        # Skip if either node missing coordinates
-        if 'lat' not in from_node or 'lat' not in to_node:
-            continue
-        
-        mode = data.get('mode', 'unknown')
-        edge_type = data.get('edge_type', '')
-        
-        # Special handling for car-to-PT connections
-        if edge_type == 'car_to_pt_transfer':
-            display_mode = 'connection'
-        else:
-            display_mode = mode
-        
-        if display_mode not in edges_by_mode:
-            edges_by_mode[display_mode] = []
-        
-        edges_by_mode[display_mode].append((u, v, data))
-        mode_counts[display_mode] = mode_counts.get(display_mode, 0) + 1
+    # Count edges by mode
+    mode_names = {code: name for name, code in mode_codes.items()}
+    codes, counts = np.unique(mode_idx[keep], return_counts=True)
+    mode_counts = {mode_names[code]: int(count) for code, count in zip(codes.tolist(), counts.tolist())}
+    
+    # Each node's coordinates bound once, in GeoJSON (lon, lat) order, and shared
+    # by every polyline through it
+    node_lonlat = list(zip(lons.tolist(), lats.tolist()))
     
     # Draw edges by mode (in specific order for layering)
     draw_order = ['car', 'walk', 'bus', 'tram', 'train', 'connection']
     
-    for mode in draw_order:
-        if mode not in edges_by_mode:
-            continue
-        
-        edges = edges_by_mode[mode]
+    selected_by_mode = {
+        mode: np.flatnonzero(keep & (mode_idx == mode_codes[mode]))
+        for mode in draw_order if mode in mode_counts
+    }
+    
+    # Chaining, simplifying and writing the GeoJSON is independent per mode, so the
+    # batched modes are built in parallel processes; their layers are added below in draw_order
+    builds = {}
+    properties_by_mode = {}
+    with ProcessPoolExecutor(max_workers=len(draw_order)) as executor:
+        for mode, selected in selected_by_mode.items():
+            if mode == 'connection':
+                continue
+            properties = {
+                'mode': mode,
+                'edges': len(selected),
+                'length_km': round(float(data.distance[selected].sum()) / 1000, 1)
+            }
+            properties_by_mode[mode] = properties
+            overview_path = edges_geojson_path(f'{mode}_overview') if mode in MAP_OVERVIEW_GRID_M else None
+            builds[mode] = executor.submit(
+                build_layer_files, mode, u_idx[selected], v_idx[selected], node_lonlat,
+                properties, edges_geojson_path(mode), overview_path
+            )
+    
+    # (layer, overview file, detail file) of the file-backed layers; layers
+    # without an overview use their detail file at both levels
+    zoom_levels = []
+    
+    for mode, selected in selected_by_mode.items():
         color = MODE_COLORS.get(mode, '#95a5a6')
         
-        logger.info(f"  Drawing {len(edges):,} {mode} edges...")
+        logger.info(f"  Drawing {len(selected):,} {mode} edges...")
         
         # Determine line properties
         if mode == 'car':
@@ -121,79 +336,95 @@ def add_edges_to_map(m, G):
             weight = 1.0
             opacity = 0.04
         
-        # Draw edges (sample if too many)
-        sample_size = 2000 if mode == 'car' else len(edges)
+        # One toggleable layer per mode
+        group = folium.FeatureGroup(name=mode, show=mode not in MAP_HIDDEN_MODES)
         
-        for u, v, data in edges[:sample_size]:
-            from_node = G.nodes[u]
-            to_node = G.nodes[v]
+        if mode == 'connection':
+            # Few enough to keep a clickable popup per edge
+            for i in selected.tolist():
+                u, v = int(u_idx[i]), int(v_idx[i])
+                
+                popup_html = CONNECTION_POPUP_TMPL.format(
+                    station=connection_names[i],
+                    distance=data.distance[i],
+                    minutes=data.time[i] / 60
+                )
+                
+                folium.PolyLine(
+                    [node_lonlat[u][::-1], node_lonlat[v][::-1]],
+                    color=color,
+                    weight=weight,
+                    opacity=opacity,
+                    popup=folium.Popup(popup_html, max_width=300)
+                ).add_to(group)
+        else:
+            # A single multi-segment polyline per mode rather than one JS object per edge,
+            # with connected edges chained and simplified to cut the vertex count.
+            # Written to a GeoJSON file next to the HTML and fetched asynchronously by
+            # the page, instead of being inlined in the HTML as one huge JS array
+            n_segments, n_points, n_overview = builds[mode].result()
+            logger.info(f"    {n_segments:,} polylines, {n_points:,} points after simplification")
+            detail_path = edges_geojson_path(mode)
             
-            # Create popup
-            distance = data.get('distance', 0)
-            time = data.get('time', 0)
+            # Dense layers open on a grid-snapped overview and load full detail when zoomed in
+            overview_path = detail_path
+            if n_overview is not None:
+                logger.info(f"    {n_overview:,} polylines in the overview (below zoom {MAP_DETAIL_ZOOM})")
+                overview_path = edges_geojson_path(f'{mode}_overview')
             
-            popup_html = f"""
-            <b>Mode:</b> {mode}<br>
-            <b>Distance:</b> {distance:.1f}m<br>
-            <b>Time:</b> {time/60:.1f} min
-            """
+            styles = {mode: {'color': color, 'weight': weight, 'opacity': opacity}}
             
-            if mode == 'connection':
-                station_name = data.get('station_name', 'Unknown')
-                popup_html = f"""
-                <b>🚗→🚉 Car to Train Transfer</b><br>
-                <b>Station:</b> {station_name}<br>
-                <b>Walking:</b> {distance:.1f}m ({time/60:.1f} min)
-                """
+            # One summary popup for the whole layer, only for the PT modes
+            popup = None
+            if mode in POPUP_MODES:
+                popup = folium.GeoJsonPopup(
+                    fields=['mode', 'edges', 'length_km'],
+                    aliases=['Mode', 'Edges', 'Length (km)']
+                )
+            
+            # The layer starts out as its feature with no coordinates, which is all
+            # folium needs for styling and popups; DetailOnZoom fetches the lines
+            layer = folium.GeoJson(
+                edges_feature_collection([], properties_by_mode[mode]),
+                style_function=lambda feature, styles=styles: styles[feature['properties']['mode']],
+                popup=popup
+            )
+            layer.add_to(group)
             
-            folium.PolyLine(
-                [(from_node['lat'], from_node['lon']),
-                 (to_node['lat'], to_node['lon'])],
-                color=color,
-                weight=weight,
-                opacity=opacity,
-                popup=folium.Popup(popup_html, max_width=300)
-            ).add_to(m)
+            # The page fetches the files relative to the HTML, not the working directory
+            zoom_levels.append((layer, os.path.basename(overview_path), os.path.basename(detail_path)))
         
-        if len(edges) > sample_size:
-            logger.info(f"    (sampled {sample_size:,} of {len(edges):,} for performance)")
+        group.add_to(m)
+    
+    if zoom_levels:
+        DetailOnZoom(zoom_levels, MAP_DETAIL_ZOOM).add_to(m)
     
     return mode_counts
 
 
-def add_train_station_markers(m, G):
+def add_train_station_markers(m, data):
     """Add markers for train stations"""
     
     logger.info("\nAdding train station markers...")
     
     train_stations = []
     
-    # Find train station nodes
-    for node, data in G.nodes(data=True):
-        if 'lat' not in data or 'lon' not in data:
+    # Endpoints of train edges, found in one pass when the map data was built
+    train_idx = np.flatnonzero(data.train_mask)
+    for i, station_name in zip(train_idx.tolist(), data.station_names.tolist()):
+        if np.isnan(data.lats[i]) or np.isnan(data.lons[i]):
             continue
         
-        # Check if this node connects to train edges
-        is_train_station = False
-        for neighbor in G[node]:
-            edge = G[node][neighbor]
-            if edge.get('mode') == 'train' or edge.get('route_type') in [1, 2]:
-                is_train_station = True
-                break
-        
-        if is_train_station:
-            station_name = data.get('station_name', str(node))
-            train_stations.append((node, station_name, data['lat'], data['lon']))
+        train_stations.append((data.node_ids[i], station_name, data.lats[i], data.lons[i]))
     
     logger.info(f"  Adding {len(train_stations)} train station markers...")
     
-    for node_id, name, lat, lon in train_stations:
-        folium.Marker(
-            location=[lat, lon],
-            popup=f"<b>🚉 {name}</b><br>ID: {node_id}",
-            icon=folium.Icon(color='blue', icon='train', prefix='fa'),
-            tooltip=name
-        ).add_to(m)
+    # Clustered and built client-side, so zoomed-out views only render cluster icons
+    FastMarkerCluster(
+        data=[[lat, lon, name, node_id] for node_id, name, lat, lon in train_stations],
+        callback=STATION_MARKER_CALLBACK,
+        name='stations'
+    ).add_to(m)
 
 
 def add_legend(m, mode_counts):
@@ -237,7 +468,7 @@ def add_legend(m, mode_counts):
     m.get_root().html.add_child(folium.Element(legend_html))
 
 
-def add_title(m, G):
+def add_title(m, data):
     """Add title overlay"""
     
     title_html = f'''
@@ -253,10 +484,10 @@ def add_title(m, G):
         Burnley → Hawthorn → Camberwell Corridor
     </p>
     <p style="margin: 5px 0; font-size: 12px; color: #999;">
-        {G.number_of_nodes():,} nodes | {G.number_of_edges():,} edges
+        {len(data.node_ids):,} nodes | {len(data.u_idx):,} edges
     </p>
     <p style="margin: 5px 0; font-size: 11px; color: #999; font-style: italic;">
-        Click edges for details | Blue markers = Train stations
+        Toggle modes top right | Click Car→Train links for details | Blue markers = Train stations
     </p>
     </div>
     '''
@@ -281,21 +512,24 @@ def main():
     logger.info("COMBINED GRAPH VISUALIZATION")
     logger.info("="*60)
     
-    # Load graph
-    G = load_combined_graph()
+    # Load node/edge arrays (from the cache when it's newer than the graph)
+    data = load_map_data()
     
     # Create map
-    m = create_map(G)
+    m = create_map(data.lats, data.lons)
     
     # Add edges
-    mode_counts = add_edges_to_map(m, G)
+    mode_counts = add_edges_to_map(m, data)
     
     # Add train station markers
-    add_train_station_markers(m, G)
+    add_train_station_markers(m, data)
     
     # Add legend and title
     add_legend(m, mode_counts)
-    add_title(m, G)
+    add_title(m, data)
+    
+    # Per-mode layer toggles
+    folium.LayerControl().add_to(m)
     
     # Save
     save_map(m)
@@ -309,8 +543,13 @@ def main():
     logger.info("  🗺️  Interactive map with zoom/pan")
     logger.info("  🎨 Color-coded by transport mode")
     logger.info("  📍 Blue markers = Train stations")
-    logger.info("  💬 Click any edge for details")
+    logger.info("  🗂️  Toggle each mode from the layer control")
+    logger.info(f"  🙈 Hidden until ticked: {', '.join(MAP_HIDDEN_MODES)}")
+    logger.info("  💬 Click Car→Train connections for details")
     logger.info("  🔗 Purple lines = Car→Train connections")
+    logger.info("\n⚠️  Edge layers load from the .geojson files next to the HTML;")
+    logger.info(f"   serve the folder over HTTP (python -m http.server -d {os.path.dirname(COMBINED_VISUALIZATION)})")
+    logger.info("   rather than opening the file directly")
 
 
 if __name__ == "__main__":
@@ -4,9 +4,11 @@ Generates a 2D plotted image of the combined graph for documentation or reports.
 """
 
 import os
-import pickle
-import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgba_array
+from numba import njit
+from scipy import ndimage
 import logging
 import sys
 
@@ -14,84 +16,142 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config_integration import (
-    COMBINED_GRAPH_PATH,
     STATIC_GRAPH_IMAGE,
     MODE_COLORS,
     LOG_LEVEL,
     LOG_FORMAT
 )
+from graph_integration.map_data import load_map_data
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
+# Output resolution of the PNG
+DPI = 300
+
+# Opacity of a single edge; overlapping edges of one mode build up like stacked alpha
+EDGE_ALPHA = 0.6
+
+
+@njit(cache=True)
+def _draw_lines(counts, x0, y0, x1, y1):
+    """Add 1 to every pixel of counts each segment (in pixel coordinates) passes through"""
+    height, width = counts.shape
+    for k in range(x0.shape[0]):
+        dx = x1[k] - x0[k]
+        dy = y1[k] - y0[k]
+        steps = int(max(abs(dx), abs(dy))) + 1
+        last_row = -1
+        last_col = -1
+        for step in range(steps + 1):
+            col = int(x0[k] + dx * step / steps)
+            row = int(y0[k] + dy * step / steps)
+            if (row != last_row or col != last_col) and 0 <= row < height and 0 <= col < width:
+                counts[row, col] += 1
+            last_row = row
+            last_col = col
+
+
+def rasterize_edges(segments, modes, layer_codes, palette, widths, xlim, ylim, shape):
+    """
+    Rasterize edge segments straight into an RGB pixel buffer (white background).
+
+    Each mode is counted per pixel, widened to its line width and blended on
+    top of the modes before it in layer_codes order.
+    """
+    height, width = shape
+    px = (segments[:, :, 0] - xlim[0]) / (xlim[1] - xlim[0]) * width
+    py = (segments[:, :, 1] - ylim[0]) / (ylim[1] - ylim[0]) * height
+
+    image = np.ones((height, width, 3))
+    for code in layer_codes:
+        selected = modes == code
+        if not selected.any():
+            continue
+        counts = np.zeros(shape, dtype=np.int32)
+        _draw_lines(counts, px[selected, 0], py[selected, 0], px[selected, 1], py[selected, 1])
+
+        # Widen the 1-pixel lines to the mode's line width with a disk footprint
+        radius = widths[code] * DPI / 72 / 2
+        reach = int(np.ceil(radius))
+        offsets = np.arange(-reach, reach + 1)
+        footprint = offsets[:, None] ** 2 + offsets[None, :] ** 2 <= radius ** 2
+        counts = ndimage.maximum_filter(counts, footprint=footprint)
 
-def load_combined_graph():
-    """Load combined multimodal graph"""
-    logger.info(f"Loading combined graph from {COMBINED_GRAPH_PATH}...")
-    with open(COMBINED_GRAPH_PATH, 'rb') as f:
-        G = pickle.load(f)
-    logger.info(f"✅ Loaded: {G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges")
-    return G
+        coverage = 1 - (1 - EDGE_ALPHA) ** counts
+        image += coverage[..., None] * (palette[code, :3] - image)
+    return image
 
 
-def visualize_graph(G):
+def visualize_graph(data):
     """Plot multimodal network as static PNG"""
     logger.info("\nGenerating static PNG visualization...")
 
-    # Prepare color map by edge mode
-    mode_edges = {mode: [] for mode in MODE_COLORS.keys()}
-    for u, v, data in G.edges(data=True):
-        mode = data.get('mode', 'unknown')
-        if mode not in MODE_COLORS:
-            mode = 'walk'  # fallback
-        mode_edges[mode].append((u, v))
+    # Edge segments as [(lon_u, lat_u), (lon_v, lat_v)], straight from the map data arrays
+    segments = np.stack([
+        np.column_stack((data.lons[data.u_idx], data.lats[data.u_idx])),
+        np.column_stack((data.lons[data.v_idx], data.lats[data.v_idx]))
+    ], axis=1)
+    has_coords = ~np.isnan(segments).any(axis=(1, 2))
 
-    # Get coordinates
-    pos = {n: (d['lon'], d['lat']) for n, d in G.nodes(data=True) if 'lat' in d and 'lon' in d}
+    # Prepare color map by edge mode
+    draw_mode = [mode if mode in MODE_COLORS else 'walk' for mode in data.mode_names.tolist()]  # fallback
 
     # Setup plot
     plt.figure(figsize=(12, 10))
     plt.axis('off')
     plt.title("Multimodal Transport Network (Burnley → Hawthorn → Box Hill)", fontsize=14, pad=20)
-
-    # Draw by mode
-    for mode, edges in mode_edges.items():
-        if not edges:
-            continue
-        nx.draw_networkx_edges(
-            G,
-            pos,
-            edgelist=edges,
-            edge_color=MODE_COLORS[mode],
-            alpha=0.6,
-            width=1.2 if mode == 'car' else 0.8
-        )
+    ax = plt.gca()
+
+    # Per mode code: color, line width (points) and layer (MODE_COLORS order, later modes on top)
+    layer_of = {mode: i for i, mode in enumerate(MODE_COLORS)}
+    palette = to_rgba_array([MODE_COLORS[mode] for mode in draw_mode])
+    widths = np.array([1.2 if mode == 'car' else 0.8 for mode in draw_mode])
+    layers = np.array([layer_of[mode] for mode in draw_mode])
+
+    # Set the view from the coordinate extremes (plus matplotlib's default 5% margin)
+    limits = []
+    for values in (segments[has_coords, :, 0], segments[has_coords, :, 1]):
+        low, high = values.min(), values.max()
+        pad = 0.05 * (high - low)
+        limits.append((low - pad, high + pad))
+    xlim, ylim = limits
+
+    # Rasterize the edges at the axes' size in the saved PNG and show them as one image,
+    # so the vector backend never has to stroke every segment
+    bbox = ax.get_window_extent()
+    shape = (round(bbox.height * DPI / ax.figure.dpi), round(bbox.width * DPI / ax.figure.dpi))
+    image = rasterize_edges(
+        segments[has_coords], data.mode_idx[has_coords], np.argsort(layers, kind='stable'),
+        palette, widths, xlim, ylim, shape
+    )
+    ax.imshow(image, extent=(*xlim, *ylim), origin='lower', aspect='auto', interpolation='nearest')
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
 
     # Draw train station nodes for visibility
-    train_nodes = [
-        n for n, d in G.nodes(data=True)
-        if any(G[n][nbr].get('mode') == 'train' for nbr in G.neighbors(n))
-    ]
-    nx.draw_networkx_nodes(G, pos, nodelist=train_nodes, node_size=20, node_color='blue', label='Train Stations')
+    train = data.train_mask & ~np.isnan(data.lats) & ~np.isnan(data.lons)
+    ax.scatter(data.lons[train], data.lats[train], s=20, c='blue', label='Train Stations', zorder=2)
 
     plt.legend(handles=[
         plt.Line2D([0], [0], color=MODE_COLORS['car'], lw=2, label='Car'),
         plt.Line2D([0], [0], color=MODE_COLORS['train'], lw=2, label='Train'),
         plt.Line2D([0], [0], color=MODE_COLORS['tram'], lw=2, label='Tram'),
         plt.Line2D([0], [0], color=MODE_COLORS['bus'], lw=2, label='Bus'),
-        plt.Line2D([0], [0], color=MODE_COLORS['walk'], lw=2, label='Walking')
+        plt.Line2D([0], [0], color=MODE_COLORS['walk'], lw=2, label='Walking'),
+        plt.Line2D([0], [0], color=MODE_COLORS['connection'], lw=2, label='Car→Train')
     ], loc='lower left', fontsize=8)
 
     # Save PNG
     os.makedirs(os.path.dirname(STATIC_GRAPH_IMAGE), exist_ok=True)
-    plt.savefig(STATIC_GRAPH_IMAGE, dpi=300, bbox_inches='tight')
+    plt.savefig(STATIC_GRAPH_IMAGE, dpi=DPI, bbox_inches='tight')
     logger.info(f"✅ Saved static graph image: {STATIC_GRAPH_IMAGE}")
     plt.close()
 
 
 def main():
-    G = load_combined_graph()
-    visualize_graph(G)
+    data = load_map_data()
+    visualize_graph(data)
 
 
 if __name__ == "__main__":